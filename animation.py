@@ -0,0 +1,82 @@
+"""Планировщик анимаций: все анимации игры продвигаются одним вызовом Animator.update на каждом кадре"""
+
+
+def linear(progress):
+    return progress
+
+
+def interpolate(start, end, progress):
+    """Функция возвращает промежуточное значение между start и end. Поддерживает числа и кортежи чисел"""
+    if isinstance(start, tuple):
+        return tuple(a + (b - a) * progress for a, b in zip(start, end))
+    return start + (end - start) * progress
+
+
+class Tween:
+    """Запись об одной анимации: setter(target, value) вызывается с промежуточными значениями от start до end"""
+    __slots__ = ('target', 'setter', 'start', 'end', 'duration', 'easing', 'group', 'elapsed')
+
+    def __init__(self, target, setter, start, end, duration, easing, group):
+        self.target, self.setter = target, setter
+        self.start, self.end = start, end
+        self.duration, self.easing = duration, easing
+        self.group = group
+        self.elapsed = 0
+
+
+class Animator:
+
+    def __init__(self):
+        # Анимации храним по ключу (объект, setter): новая анимация того же свойства заменяет предыдущую
+        self.tweens = {}
+        self.group_counts = {}
+
+    def add(self, target, setter, start, end, duration, easing=linear, group=None):
+        """Метод запускает анимацию. Если duration равна нулю, конечное значение устанавливается сразу"""
+        self.cancel(target, setter)
+        if duration <= 0:
+            setter(target, end)
+            return
+
+        group = target if group is None else group
+        self.tweens[(target, setter)] = Tween(target, setter, start, end, duration, easing, group)
+        self.group_counts[group] = self.group_counts.get(group, 0) + 1
+
+    def cancel(self, target, setter=None):
+        """Метод останавливает анимации объекта, оставляя его в текущем состоянии"""
+        keys = [(target, setter)] if setter else [key for key in self.tweens if key[0] is target]
+        for key in keys:
+            tween = self.tweens.pop(key, None)
+            if tween:
+                self._release_group(tween.group)
+
+    def clear(self):
+        """Метод останавливает все анимации"""
+        self.tweens.clear()
+        self.group_counts.clear()
+
+    def update(self, dt):
+        """Метод продвигает все анимации на dt секунд"""
+        for key, tween in list(self.tweens.items()):
+            tween.elapsed += dt
+            progress = min(1, tween.elapsed / tween.duration)
+            tween.setter(tween.target, interpolate(tween.start, tween.end, tween.easing(progress)))
+            if progress == 1:
+                del self.tweens[key]
+                self._release_group(tween.group)
+
+    def is_active(self, group=None):
+        """Метод возвращает True, если есть незавершенные анимации (во всей игре или в переданной группе)"""
+        if group is None:
+            return bool(self.tweens)
+        return group in self.group_counts
+
+    def _release_group(self, group):
+        count = self.group_counts[group] - 1
+        if count:
+            self.group_counts[group] = count
+        else:
+            del self.group_counts[group]
+
+
+animator = Animator()
@@ -0,0 +1,214 @@
+"""
+Пакетная среда для обучения агентов: B партий хранятся в общих массивах NumPy и продвигаются одним вызовом step.
+Правила совпадают с core.Board, на котором построены Field и Pool.
+Проверка совпадения с core.Board и замер скорости: python batch_env.py --check
+"""
+import sys
+import random
+import argparse
+from time import perf_counter
+import numpy as np
+from settings import LAYERS_COUNT, POOL_SIZE, FIGURES_DATA
+from core import Board, SHAPES_OFFSETS, get_score_increment
+
+
+class BatchEnv:
+    """
+    Действие - номер слота пула, умноженный на количество гексов поля, плюс номер гекса под первым гексом фигуры.
+    Наблюдение - словарь с занятостью гексов (B x количество гексов) и номерами фигур в слотах пула (B x POOL_SIZE)
+    """
+
+    def __init__(self, batch_size, layers_count=LAYERS_COUNT, seed=None):
+        board = Board(layers_count)
+        self.batch_size = batch_size
+        self.cells_count = cells_count = len(board)
+        self.actions_count = POOL_SIZE * cells_count
+        self.rng = np.random.default_rng(seed)
+
+        # За последним гексом поля в массиве занятости идут два служебных столбца: всегда занятый гекс,
+        # на который ссылаются выходящие за пределы поля размещения, и всегда свободный гекс для выравнивания
+        # размещений фигур разного размера
+        self.outside_cell = cells_count
+        self.padding_cell = cells_count + 1
+
+        # Номер гекса по координатам на осях x и y (третья координата равна -x - y): квадратная таблица
+        # со стороной 2 * layers_count + 1, клетки вне поля ссылаются на всегда занятый гекс
+        axises = np.stack([board.index.x_axises, board.index.y_axises, board.index.z_axises], axis=1).astype(np.int32)
+        side = 2 * layers_count + 1
+        numbers = np.full((side + 1) * side, self.outside_cell, np.int32)
+        numbers[(axises[:, 0] + layers_count) * side + axises[:, 1] + layers_count] = np.arange(cells_count)
+
+        # Номера гексов для каждого размещения: фигура x гекс под первым гексом фигуры x гексы фигуры.
+        # Смещения фигур дополняются нулевыми, а соответствующие им гексы заменяются всегда свободным гексом
+        self.shape_sizes = np.array([len(offsets) for offsets in SHAPES_OFFSETS])
+        offsets = np.zeros((len(SHAPES_OFFSETS), self.shape_sizes.max(), 3), np.int32)
+        for shape_index, shape_offsets in enumerate(SHAPES_OFFSETS):
+            offsets[shape_index, :len(shape_offsets)] = shape_offsets
+        placed = axises[None, :, None] + offsets[:, None]
+        inside = np.abs(placed).max(axis=3) <= layers_count
+        # Гексы за пределами поля сводятся к координате side на оси x, то есть к строке таблицы из одних
+        # всегда занятых гексов
+        rows = np.where(inside, placed[..., 0] + layers_count, side)
+        columns = np.where(inside, placed[..., 1] + layers_count, 0)
+        padding = np.arange(offsets.shape[1]) >= self.shape_sizes[:, None]
+        self.shape_cells = np.where(padding[:, None], self.padding_cell, numbers[rows * side + columns])
+
+        # Линии поля: линия x гексы линии. Короткие линии дополняются всегда занятым гексом
+        self.line_cells = np.full((len(board.lines), max(map(len, board.lines))), self.outside_cell, np.int32)
+        for line_index, line in enumerate(board.lines):
+            self.line_cells[line_index, :len(line)] = line
+
+        self.occupancy = np.zeros((batch_size, cells_count + 2), np.uint8)
+        self.shapes = np.zeros((batch_size, POOL_SIZE), np.int64)
+        self.scores = np.zeros(batch_size)
+        self.legal = np.zeros((batch_size, POOL_SIZE, cells_count), bool)
+        self.done = np.zeros(batch_size, bool)
+        self.reset()
+
+    def reset(self, mask=None):
+        """Метод начинает заново партии, отмеченные в mask (по умолчанию все), и возвращает наблюдения"""
+        rows = np.arange(self.batch_size) if mask is None else np.flatnonzero(mask)
+        self.occupancy[rows] = 0
+        self.occupancy[:, self.outside_cell] = 1
+        self.shapes[rows] = self.rng.integers(len(FIGURES_DATA), size=(len(rows), POOL_SIZE))
+        self.scores[rows] = 0
+        self._update_legal()
+        return self.get_observations()
+
+    def step(self, actions):
+        """
+        Метод делает по одному ходу в каждой незаконченной партии и возвращает наблюдения, награды (очки за ход),
+        маски доступных действий (B x POOL_SIZE x количество гексов) и признаки окончания партий.
+        Действия для законченных партий игнорируются
+        """
+        actions = np.asarray(actions)
+        rows = np.flatnonzero(~self.done)
+        slots, anchors = np.divmod(actions[rows], self.cells_count)
+        if not self.legal[rows, slots, anchors].all():
+            raise ValueError('Недопустимое действие в партиях {}'.format(rows[~self.legal[rows, slots, anchors]]))
+
+        # Размещаем фигуры
+        shapes = self.shapes[rows, slots]
+        self.occupancy[rows[:, None], self.shape_cells[shapes, anchors]] = 1
+        self.occupancy[:, self.padding_cell] = 0
+
+        # Удаляем заполненные линии
+        full_lines = self.occupancy[rows[:, None, None], self.line_cells].all(axis=2)
+        full_rows, full_line_indices = np.nonzero(full_lines)
+        self.occupancy[rows[full_rows, None], self.line_cells[full_line_indices]] = 0
+        self.occupancy[:, self.outside_cell] = 1
+
+        rewards = np.zeros(self.batch_size)
+        rewards[rows] = get_score_increment(self.shape_sizes[shapes], full_lines.sum(axis=1))
+        self.scores += rewards
+
+        # Пополняем пул и проверяем, остались ли ходы
+        self.shapes[rows, slots] = self.rng.integers(len(FIGURES_DATA), size=len(rows))
+        self._update_legal()
+        return self.get_observations(), rewards, self.legal, self.done
+
+    def get_observations(self):
+        return {'occupancy': self.occupancy[:, :self.cells_count], 'shapes': self.shapes}
+
+    def get_legal_actions(self):
+        """Метод возвращает маску доступных действий в плоском виде: B x (POOL_SIZE * количество гексов)"""
+        return self.legal.reshape(self.batch_size, self.actions_count)
+
+    def _update_legal(self):
+        # Сначала выбираем размещения фигур, лежащих в пуле, и только потом берем занятость их гексов, по одному
+        # гексу фигуры за раз: временные массивы имеют размер B x количество гексов, а не B x все фигуры x
+        # количество гексов x гексы фигуры
+        rows = np.arange(self.batch_size)[:, None]
+        self.legal = np.ones((self.batch_size, POOL_SIZE, self.cells_count), bool)
+        for slot in range(POOL_SIZE):
+            for cell_index in range(self.shape_cells.shape[2]):
+                cells = self.shape_cells[self.shapes[:, slot], :, cell_index]
+                self.legal[:, slot] &= self.occupancy[rows, cells] == 0
+        self.done = ~self.legal.any(axis=(1, 2))
+
+
+def check_parity(batch_size, steps, layers_count, seed):
+    """
+    Функция играет случайные партии в пакетной среде и параллельно на core.Board с теми же фигурами
+    и сравнивает занятость поля, очки, доступные ходы и окончание партий. Возвращает количество расхождений
+    """
+    env = BatchEnv(batch_size, layers_count, seed)
+    boards = [Board(layers_count) for _ in range(batch_size)]
+    rng = random.Random(seed)
+    mismatches = 0
+
+    def report(row, step, message):
+        nonlocal mismatches
+        mismatches += 1
+        print('Партия {}, ход {}: {}'.format(row, step, message))
+
+    for step in range(steps):
+        actions = np.zeros(batch_size, np.int64)
+        for row in np.flatnonzero(~env.done):
+            actions[row] = rng.choice(np.flatnonzero(env.get_legal_actions()[row]))
+        shapes_before = env.shapes.copy()
+        done_before = env.done.copy()
+        _, rewards, legal, done = env.step(actions)
+
+        for row, board in enumerate(boards):
+            if done_before[row]:
+                continue
+            slot_index, number = divmod(int(actions[row]), env.cells_count)
+            shape_index = int(shapes_before[row, slot_index])
+            numbers = board.get_figure_cells(FIGURES_DATA[shape_index], number)
+            if not numbers or not board.put(numbers, 0):
+                report(row, step, 'ход недопустим на core.Board')
+                continue
+            board.refresh()
+
+            occupancy = [int(not board.is_free(cell)) for cell in range(len(board))]
+            if occupancy != env.occupancy[row, :env.cells_count].tolist():
+                report(row, step, 'различается занятость гексов')
+            if get_score_increment(*board.get_scored_data()) != rewards[row]:
+                report(row, step, 'различаются очки за ход')
+            shape_indices = env.shapes[row].tolist()
+            for slot, slot_shape in enumerate(shape_indices):
+                if board.get_legal_placements(slot_shape) != np.flatnonzero(legal[row, slot]).tolist():
+                    report(row, step, 'различаются доступные ходы фигуры {}'.format(slot_shape))
+            if (not board.check_figures_list(shape_indices)) != done[row]:
+                report(row, step, 'различается окончание партии')
+
+        if env.done.all():
+            break
+    return mismatches
+
+
+def measure_speed(batch_size, steps, layers_count, seed):
+    """Функция возвращает количество ходов в секунду при случайной игре с перезапуском законченных партий"""
+    env = BatchEnv(batch_size, layers_count, seed)
+    rng = np.random.default_rng(seed)
+    start = perf_counter()
+    for _ in range(steps):
+        # Случайное доступное действие: максимум случайных чисел среди доступных действий
+        legal = env.get_legal_actions()
+        actions = np.where(legal, rng.random(legal.shape), -1).argmax(axis=1)
+        env.step(actions)
+        if env.done.any():
+            env.reset(env.done)
+    return batch_size * steps / (perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пакетная среда: проверка совпадения правил и замер скорости')
+    parser.add_argument('--check', action='store_true', help='сравнить правила с core.Board')
+    parser.add_argument('--batch-size', type=int, default=256, help='количество партий в пакете')
+    parser.add_argument('--steps', type=int, default=200, help='количество ходов')
+    parser.add_argument('--layers', type=int, default=LAYERS_COUNT, help='количество слоев поля')
+    parser.add_argument('--seed', type=int, default=0, help='зерно генератора')
+    args = parser.parse_args()
+
+    if args.check:
+        mismatches = check_parity(args.batch_size, args.steps, args.layers, args.seed)
+        print('Расхождений с core.Board: {}'.format(mismatches))
+        if mismatches:
+            sys.exit(1)
+    print('Ходов в секунду: {:.0f}'.format(measure_speed(args.batch_size, args.steps, args.layers, args.seed)))
+
+
+if __name__ == '__main__':
+    main()
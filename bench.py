@@ -0,0 +1,248 @@
+"""
+Замеры производительности основных операций с игровым полем и пулом фигур на полях разного размера.
+Запуск: python bench.py [--layers 4 10 20 40] [--output bench_results.json] [--compare baseline.json]
+"""
+import gc
+import os
+import sys
+import json
+import random
+import platform
+import argparse
+import tracemalloc
+from statistics import median
+from time import perf_counter
+
+# Замеры выполняются без окна
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import pygame as pg
+
+from settings import W, H, COLOR_PRESETS, CAMERA_ZOOM_STEP, CAMERA_MAX_ZOOM, SCALE_STEP
+from core import Board
+from classes import Field, Pool, get_hexagon_blit
+from animation import animator
+from utils import get_hexagon_template
+
+DEFAULT_LAYERS = [4, 10, 20, 40]
+FILL_RATIO = 0.35
+
+
+def create_board_state(layers_count, rng):
+    """Функция возвращает случайное состояние поля (без полных линий): пары (номер гекса, номер цвета)"""
+    board = Board(layers_count)
+    numbers = [number for number in range(len(board)) if rng.random() < FILL_RATIO]
+    for number in numbers:
+        board.put([number], rng.randrange(len(COLOR_PRESETS)))
+    board.refresh()
+    return [(number, board.colors[number]) for number in range(len(board)) if not board.is_free(number)]
+
+
+def load_board_state(field, state):
+    board = field.board
+    board.occupancy = 0
+    board.colors = bytearray(len(board))
+    for number, color_index in state:
+        board.occupancy |= 1 << number
+        board.colors[number] = color_index
+    board.reset_counters()
+    field.sync_with_board()
+
+
+def place_figure_over(field, figure, number):
+    """Функция перемещает фигуру так, чтобы её первый гекс оказался над гексом поля с переданным номером"""
+    hexagon = field.hexagon_list[number]
+    figure.move_to(field.camera.world_to_screen(hexagon.x0, hexagon.y0))
+
+
+def measure(setup, run, repeat):
+    """Функция выполняет run repeat раз, каждый раз предварительно вызывая setup, и возвращает замеры в микросекундах"""
+    timings = []
+    for _ in range(repeat):
+        args = setup()
+        start = perf_counter()
+        run(*args)
+        timings.append((perf_counter() - start) * 1000000)
+    return {'min': min(timings), 'median': median(timings), 'mean': sum(timings) / len(timings), 'repeat': repeat}
+
+
+def measure_memory(create, count):
+    """Функция возвращает объем памяти, выделенной при вызове create, в байтах на каждый из count элементов"""
+    # Собираем мусор заранее, чтобы сборка во время замера не искажала результат
+    gc.collect()
+    tracemalloc.start()
+    result = create()
+    size = tracemalloc.get_traced_memory()[0] / count
+    tracemalloc.stop()
+    del result
+    return {'min': size, 'median': size, 'mean': size, 'repeat': 1, 'unit': 'B'}
+
+
+def run_benchmarks(sc, layers_count, repeat, seed):
+    rng = random.Random(seed * 1000 + layers_count)
+    field = Field(sc, Board(layers_count))
+    pool = Pool(sc)
+    pool.refresh_slots()
+    state = create_board_state(layers_count, rng)
+    load_board_state(field, state)
+    figures_list = pool.get_current_figures_list()
+    results = {}
+
+    results['Field.__init__'] = measure(lambda: (), lambda: Field(sc, Board(layers_count)), max(3, repeat // 20))
+
+    # Память поля вместе с Board: маски линий и счетчики размещений Board растут вместе с полем.
+    # Таблицы, общие для всех полей одного размера, к этому времени уже созданы и не учитываются
+    results['Board memory per cell'] = measure_memory(lambda: Board(layers_count), len(field.board))
+    results['Field+Board memory per cell'] = measure_memory(lambda: Field(sc, Board(layers_count)), len(field.board))
+
+    # Проходы по всем гексам поля: синхронизация с Board и полная перерисовка видимой части
+    results['Field.sync_with_board'] = measure(lambda: (), field.sync_with_board, max(3, repeat // 20))
+
+    def full_redraw_setup():
+        field.update_flag = True
+        return ()
+
+    results['Field.update[full]'] = measure(full_redraw_setup, field.update, max(3, repeat // 20))
+
+    def pan_setup():
+        # Сдвиг камеры при увеличенном поле: перерисовываются только открывшиеся полосы
+        if field.camera.zoom == field.camera.min_zoom:
+            field.camera.zoom_at(CAMERA_ZOOM_STEP ** 10, *sc.get_rect().center)
+            field.update()
+        field.camera.pan(rng.choice((-1, 1)) * 10, rng.choice((-1, 1)) * 10)
+        return ()
+
+    results['Field.update[pan]'] = measure(pan_setup, field.update, max(3, repeat // 20))
+    field.camera.zoom_at(field.camera.min_zoom / field.camera.zoom, *sc.get_rect().center)
+    field.update()
+
+    def put_figure_setup():
+        load_board_state(field, state)
+        figure = rng.choice(figures_list)
+        placements = field.board.get_legal_placements(figure.shape_index)
+        place_figure_over(field, figure, rng.choice(placements) if placements else 0)
+        return figure,
+
+    results['Field.put_figure'] = measure(put_figure_setup, field.put_figure, repeat)
+
+    def refresh_field_setup():
+        # Заполняем случайную линию, чтобы было что удалять
+        load_board_state(field, state)
+        line = rng.choice(field.board.lines)
+        free_numbers = [number for number in line if field.board.is_free(number)]
+        field.board.put(free_numbers, 0)
+        field.sync_with_board()
+        return ()
+
+    results['Field.refresh_field'] = measure(refresh_field_setup, field.refresh_field, repeat)
+
+    def effect_frame_setup():
+        # Кадр в середине эффекта удаления линии: поле уже отрисовано, эффект еще не закончился
+        refresh_field_setup()
+        field.update()
+        field.refresh_field()
+        field.update()
+        animator.update(0.1)
+        return ()
+
+    results['Field.update[effect]'] = measure(effect_frame_setup, field.update, max(3, repeat // 20))
+    animator.clear()
+
+    load_board_state(field, state)
+    results['Field.check_figures_list'] = measure(
+        lambda: (figures_list,), field.check_figures_list, repeat
+    )
+
+    def free_hexagons_setup():
+        figure = rng.choice(figures_list)
+        place_figure_over(field, figure, rng.randrange(len(field.board)))
+        return figure,
+
+    results['Field._get_free_numbers_under_figure'] = measure(
+        free_hexagons_setup, field._get_free_numbers_under_figure, repeat
+    )
+
+    def refresh_slots_setup():
+        for slot_index, slot in enumerate(pool.slots):
+            if slot['figure']:
+                pool.release(slot['figure'])
+                slot['figure'] = None
+                pool.figure_pool.take(slot_index)
+        return ()
+
+    results['Pool.refresh_slots'] = measure(refresh_slots_setup, pool.refresh_slots, repeat)
+
+    # Шаблон гекса строится заново: кэш очищается перед каждым замером
+    def hexagon_template_setup():
+        get_hexagon_template.cache_clear()
+        return round(rng.uniform(0.1, CAMERA_MAX_ZOOM) / SCALE_STEP),
+
+    results['get_hexagon_template'] = measure(hexagon_template_setup, get_hexagon_template, repeat)
+    results['get_hexagon_blit'] = measure(
+        lambda: (rng.choice(COLOR_PRESETS), rng.uniform(0.1, CAMERA_MAX_ZOOM), rng.uniform(0, W), rng.uniform(0, H)),
+        get_hexagon_blit, repeat
+    )
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Функция сравнивает медианы замеров с базовыми и возвращает список регрессий"""
+    regressions = []
+    for key, result in results.items():
+        base_result = baseline['results'].get(key)
+        if not base_result:
+            continue
+        ratio = result['median'] / base_result['median'] if base_result['median'] else 1
+        if ratio > 1 + threshold:
+            regressions.append((key, base_result['median'], result['median'], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры производительности Field и Pool')
+    parser.add_argument('--layers', type=int, nargs='+', default=DEFAULT_LAYERS, help='количество слоев поля')
+    parser.add_argument('--repeat', type=int, default=200, help='количество повторов каждого замера')
+    parser.add_argument('--seed', type=int, default=0, help='зерно генератора случайных состояний поля')
+    parser.add_argument('--output', default='bench_results.json', help='файл для сохранения результатов')
+    parser.add_argument('--compare', help='файл с базовыми результатами для поиска регрессий')
+    parser.add_argument('--threshold', type=float, default=0.1, help='допустимое относительное замедление')
+    args = parser.parse_args()
+
+    pg.init()
+    sc = pg.display.set_mode((W, H))
+
+    results = {}
+    for layers_count in args.layers:
+        for name, result in run_benchmarks(sc, layers_count, args.repeat, args.seed).items():
+            key = '{}[layers={}]'.format(name, layers_count)
+            results[key] = result
+            unit = result.get('unit', 'us')
+            print('{:<60} median {:>12.1f} {:<2}   min {:>12.1f} {}'.format(
+                key, result['median'], unit, result['min'], unit
+            ))
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'pygame': pg.version.ver,
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'repeat': args.repeat
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.threshold)
+        for key, base_median, median_value, ratio in regressions:
+            print('REGRESSION {}: {:.1f} us -> {:.1f} us (x{:.2f})'.format(key, base_median, median_value, ratio))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,16 @@
+import os
 import random
-from copy import deepcopy
-from math import pi, sin, cos
-from settings import pg, W, H, LAYERS_COUNT, NORMAL, D_PARAMS, EMPTY_HEXAGON_COLOR, FIGURES_DATA, COLOR_PRESETS, \
-    TRANSPARENT_COLOR, BACKGROUND_COLORS_RANGE, FONT_COLOR, MARKED_HEXAGON_COLOR
-from utils import create_hexagon_coords, normalize_value, get_distance
+from array import array
+from collections.abc import Sequence
+from functools import lru_cache
+from math import pi, sin, cos, ceil, floor, sqrt
+import pygame as pg
+from settings import W, H, FPS, RADIUS, NORMAL, POOL_SIZE, EMPTY_HEXAGON_COLOR, FIGURES_DATA, COLOR_PRESETS, \
+    TRANSPARENT_COLOR, BACKGROUND_COLORS_RANGE, BACKGROUND_SEED, BACKGROUND_CACHE_DIR, FONT_COLOR, \
+    MARKED_HEXAGON_COLOR, SCALE_STEP, SMOOTH_DEPTH, SPRITE_CACHE_SIZE, CAMERA_MAX_ZOOM, LOD_RADIUS
+from utils import create_hexagon_coords, get_hexagon_extents, get_distance, cube_to_pixel, pixel_to_cube
+from core import Board, FigurePool, SHAPES_OFFSETS, get_score_increment, iter_bits
+from animation import animator
 
 
 class Background:
@@ -11,147 +18,240 @@ class Background:
 
     def __init__(self, sc):
         self.sc = sc
-        self.surface = pg.Surface((W, H))
-        for y in range(0, H, self.STEP):
-            for x in range(0, W, self.STEP):
-                color_component = random.randint(*BACKGROUND_COLORS_RANGE)
-                color = (color_component,) * 3
-                pg.draw.rect(self.surface, color, (x, y, self.STEP, self.STEP))
+        self.rect = pg.Rect(0, 0, W, H)
+
+        # Если задано зерно генератора, то фон будет одинаковым при каждом запуске и его можно хранить на диске
+        cache_path = None
+        if BACKGROUND_SEED is not None:
+            cache_name = 'background_{}x{}_{}_{}-{}_{}.png'.format(
+                W, H, self.STEP, *BACKGROUND_COLORS_RANGE, BACKGROUND_SEED
+            )
+            cache_path = os.path.join(BACKGROUND_CACHE_DIR, cache_name)
+            if os.path.exists(cache_path):
+                self.surface = pg.image.load(cache_path)
+                self.update_flag = True
+                return
+
+        self.surface = self._create_surface(random.Random(BACKGROUND_SEED))
+        if cache_path:
+            try:
+                os.makedirs(BACKGROUND_CACHE_DIR, exist_ok=True)
+                pg.image.save(self.surface, cache_path)
+            except (OSError, pg.error):
+                pass
+        self.update_flag = True
+
+    def update(self):
+        """Метод возвращает список изменившихся с прошлого кадра областей экрана"""
+        if not self.update_flag:
+            return []
+        self.update_flag = False
+        return [self.rect]
 
     def draw(self):
-        self.sc.blit(self.surface, (0, 0))
+        self.sc.blit(self.surface, self.rect)
+
+    def _create_surface(self, rng):
+        """Метод создает шум в низком разрешении (пиксель на каждый квадрат STEP x STEP) и растягивает его на экран"""
+        grid_width, grid_height = ceil(W / self.STEP), ceil(H / self.STEP)
+        min_color, max_color = BACKGROUND_COLORS_RANGE
+        color_table = bytes(min_color + value % (max_color - min_color + 1) for value in range(256))
+        grid = rng.randbytes(grid_width * grid_height).translate(color_table)
+
+        # Серый цвет: одинаковые значения во всех трех каналах
+        pixels = bytearray(len(grid) * 3)
+        pixels[0::3] = pixels[1::3] = pixels[2::3] = grid
+        noise = pg.image.frombuffer(pixels, (grid_width, grid_height), 'RGB')
+        surface = pg.transform.scale(noise, (grid_width * self.STEP, grid_height * self.STEP))
+        return surface.subsurface(self.rect).copy()
+
+
+@lru_cache(maxsize=SPRITE_CACHE_SIZE)
+def get_hexagon_sprite(color, scale_steps, detailed=True):
+    """
+    Функция возвращает заранее отрисованный гекс переданного цвета с масштабом scale_steps * SCALE_STEP.
+    Упрощенный гекс рисуется без сглаживания углов и рамки
+    """
+    size = 2 * ceil(scale_steps * SCALE_STEP * RADIUS) + 2
+    sprite = pg.Surface((size, size), pg.SRCALPHA)
+    coords = create_hexagon_coords(size / 2, size / 2, scale_steps * SCALE_STEP, SMOOTH_DEPTH if detailed else 0)
+    pg.draw.polygon(sprite, color, coords)
+    if detailed:
+        border_color = max(10, color[0] - 50), max(10, color[1] - 50), max(10, color[2] - 50)
+        pg.draw.lines(sprite, border_color, True, coords)
+    return sprite
+
+
+def get_hexagon_blit(color, scale, x0, y0):
+    """Функция возвращает пару (спрайт, позиция) для отрисовки гекса с центром в точке (x0, y0) через Surface.blits"""
+    scale_steps = max(1, round(scale / SCALE_STEP))
+    sprite = get_hexagon_sprite(color, scale_steps, scale * RADIUS >= LOD_RADIUS)
+    half_size = sprite.get_width() / 2
+    return sprite, (round(x0 - half_size), round(y0 - half_size))
+
+
+def get_rect_difference(rect, other):
+    """Функция возвращает до четырех прямоугольников, покрывающих часть rect за пределами other"""
+    other = rect.clip(other)
+    if not other:
+        return [rect] if rect else []
+    rects = [
+        pg.Rect(rect.left, rect.top, rect.width, other.top - rect.top),
+        pg.Rect(rect.left, other.bottom, rect.width, rect.bottom - other.bottom),
+        pg.Rect(rect.left, other.top, other.left - rect.left, other.height),
+        pg.Rect(other.right, other.top, rect.right - other.right, other.height)
+    ]
+    return [part for part in rects if part.width > 0 and part.height > 0]
 
 
 class Hexagon:
-    FAST_SCALE_SPEED = 0.2
-    NORMAL_SCALE_SPEED = 0.1
+    __slots__ = ('x0', 'y0', 'current_scale', 'color')
+
+    # Скорости изменения масштаба в единицах масштаба за секунду
+    FAST_SCALE_SPEED = 6
+    NORMAL_SCALE_SPEED = 3
 
     def __init__(self, x0, y0, ):
         self.x0, self.y0 = x0, y0
         self.current_scale = 1
-        self.coords = create_hexagon_coords(x0, y0, self.current_scale)
-        self.process_list = []
 
-    def draw(self, surface):
-        color = getattr(self, 'color')
-        self._execute_process_list()
-        pg.draw.polygon(surface, color, self.coords)
-        pg.draw.lines(surface, self._get_border_color(), True, self.coords)
+    def get_blit(self, delta_x=0, delta_y=0):
+        """Метод возвращает пару (спрайт, позиция) для отрисовки через Surface.blits"""
+        return get_hexagon_blit(self.color, self.current_scale, self.x0 + delta_x, self.y0 + delta_y)
 
-    def collide(self, x, y):
-        tmp_coords = self.coords + [self.coords[0]]
-        for (x1, y1), (x2, y2) in ((tmp_coords[index], tmp_coords[index + 1]) for index in range(len(tmp_coords) - 1)):
-            a, b, c = y2 - y1, x1 - x2, y1 * (x2 - x1) - x1 * (y2 - y1)
-            dot_val = normalize_value(a * x + b * y + c)
-            if dot_val == 0:
-                return True
+    def get_rect(self):
+        sprite, position = self.get_blit()
+        return pg.Rect(position, sprite.get_size())
 
-            center_val = normalize_value(a * self.x0 + b * self.y0 + c)
-            if dot_val != center_val:
-                return False
-
-        return True
+    def collide(self, x, y):
+        return pixel_to_cube(x - self.x0, y - self.y0, NORMAL * self.current_scale) == (0, 0, 0)
 
     def scale(self, next_scale):
         self.current_scale = next_scale
-        self.coords = create_hexagon_coords(self.x0, self.y0, next_scale)
 
-    def start_scale_process(self, target_scale, step_scale):
-        def process():
-            if self.current_scale < target_scale:
-                self.current_scale = min(target_scale, self.current_scale + step_scale)
-                self.coords = create_hexagon_coords(self.x0, self.y0, self.current_scale)
-            elif self.current_scale > target_scale:
-                self.current_scale = max(target_scale, self.current_scale - step_scale)
-                self.coords = create_hexagon_coords(self.x0, self.y0, self.current_scale)
-            return self.current_scale == target_scale
 
-        self.process_list.append(process)
+# Цвета гексов поля хранятся номерами в палитре: пустой гекс, помеченный гекс, затем цвета из COLOR_PRESETS
+EMPTY_COLOR_ID = 0
+MARKED_COLOR_ID = 1
+PRESET_COLOR_ID = 2
+PALETTE = [EMPTY_HEXAGON_COLOR, MARKED_HEXAGON_COLOR] + list(COLOR_PRESETS)
 
-    def has_process(self):
-        return len(self.process_list) != 0
 
-    def _get_border_color(self):
-        color = getattr(self, 'color')
-        return max(10, color[0] - 50), max(10, color[1] - 50), max(10, color[2] - 50)
+class FieldHexagon:
+    """
+    Гекс игрового поля. Сам гекс ничего не хранит: это представление ячейки, данные которой лежат в массивах поля.
+    Представления создаются по запросу и только для чтения
+    """
+    __slots__ = ('field', 'number')
 
-    def _execute_process_list(self):
-        if not self.process_list:
-            return
-        next_process_list = []
-        for process in self.process_list:
-            end_flag = process()
-            if not end_flag:
-                next_process_list.append(process)
-        self.process_list = next_process_list
+    def __init__(self, field, number):
+        self.field = field
+        self.number = number
+
+    @property
+    def x0(self):
+        return self.field.centers_x[self.number]
+
+    @property
+    def y0(self):
+        return self.field.centers_y[self.number]
 
+    @property
+    def x_axis(self):
+        return self.field.board.index.x_axises[self.number]
 
-class FieldHexagon(Hexagon):
+    @property
+    def y_axis(self):
+        return self.field.board.index.y_axises[self.number]
 
-    def __init__(self, x0, y0, x_axis, y_axis, z_axis):
-        Hexagon.__init__(self, x0, y0)
-        self.x_axis, self.y_axis, self.z_axis = x_axis, y_axis, z_axis
-        self.content = False
-        self.color = EMPTY_HEXAGON_COLOR
+    @property
+    def z_axis(self):
+        return self.field.board.index.z_axises[self.number]
 
+    @property
+    def content(self):
+        return not self.field.board.is_free(self.number)
 
-class FigureHexagon(Hexagon):
-    STEP_MOTION = 100
+    @property
+    def color(self):
+        return PALETTE[self.field.color_ids[self.number]]
+
+    def get_blit(self):
+        """Метод возвращает пару (спрайт, позиция) в мировых координатах поля"""
+        return get_hexagon_blit(self.color, 1, self.x0, self.y0)
+
+    def get_rect(self):
+        sprite, position = self.get_blit()
+        return pg.Rect(position, sprite.get_size())
+
+    def __eq__(self, other):
+        return isinstance(other, FieldHexagon) and (self.field, self.number) == (other.field, other.number)
+
+    def __hash__(self):
+        return hash((id(self.field), self.number))
 
-    def __init__(self, x0, y0):
-        Hexagon.__init__(self, x0, y0)
-        self.target_x0, self.target_y0 = self.x0, self.y0
+
+class FieldHexagonList(Sequence):
+    """Последовательность гексов поля, которая создает представления гексов при обращении к ним"""
+
+    def __init__(self, field):
+        self.field = field
+
+    def __len__(self):
+        return len(self.field.board)
+
+    def __getitem__(self, number):
+        if number < 0:
+            number += len(self)
+        if not 0 <= number < len(self):
+            raise IndexError('Номер гекса вне поля: {}'.format(number))
+        return FieldHexagon(self.field, number)
+
+
+class FigureHexagon(Hexagon):
+    __slots__ = ()
 
     def offset(self, delta_x, delta_y):
         self.x0, self.y0 = self.x0 + delta_x, self.y0 + delta_y
-        self.coords = create_hexagon_coords(self.x0, self.y0, self.current_scale)
-
-    def start_offset_process(self, dx, dy):
-        target_x, target_y = self.x0 + dx, self.y0 + dy
-
-        def process():
-            current_distance = get_distance(self.x0, self.y0, target_x, target_y)
-            # Предотвращаем деление на ноль, если игрок возьмёт и сразу же отпустит фигурку
-            if current_distance == 0:
-                return True
-            delta_x = self.STEP_MOTION * ((target_x - self.x0) / current_distance)
-            delta_y = self.STEP_MOTION * ((target_y - self.y0) / current_distance)
-            next_x0, next_y0 = self.x0 + delta_x, self.y0 + delta_y
-            next_distance = get_distance(next_x0, next_y0, target_x, target_y)
-            if next_distance < current_distance:
-                self.offset(delta_x, delta_y)
-            else:
-                self.x0, self.y0 = target_x, target_y
-                self.coords = create_hexagon_coords(self.x0, self.y0, self.current_scale)
-            return (self.x0, self.y0) == (target_x, target_y)
-
-        self.process_list.append(process)
 
 
 class Figure:
+    # Скорость перемещения в пикселях за секунду
+    MOTION_SPEED = 3000
 
-    def __init__(self, hexagon_list, data_for_create):
+    def __init__(self, hexagon_list, data_for_create, shape_index):
         self._color = None
+        self.color_index = None
         self.hexagon_list = hexagon_list
         self.data_for_create = data_for_create
-        self.width = self.max_x - self.min_x
-        self.height = self.max_y - self.min_y
+        self.shape_index = shape_index
+        self.current_scale = 1
 
-    @property
-    def min_x(self):
-        return min(x for hexagon in self.hexagon_list for x, _ in hexagon.coords)
+        # Габариты фигуры не пересчитываются по координатам гексов, а обновляются при смещении и масштабировании.
+        # Для этого запоминаем положение центров гексов относительно центра первого гекса при исходном расстоянии
+        # между гексами. spacing - во сколько раз текущее расстояние между гексами отличается от исходного
+        x0, y0 = self.x0, self.y0
+        self.offsets = [(hexagon.x0 - x0, hexagon.y0 - y0) for hexagon in hexagon_list]
+        self.spacing = 1
+        self.centers_bounds = (
+            min(hexagon.x0 for hexagon in hexagon_list) - x0,
+            max(hexagon.x0 for hexagon in hexagon_list) - x0,
+            min(hexagon.y0 for hexagon in hexagon_list) - y0,
+            max(hexagon.y0 for hexagon in hexagon_list) - y0
+        )
+        self.min_x = self.max_x = self.min_y = self.max_y = 0
+        self._update_bounds()
 
-    @property
-    def max_x(self):
-        return max(x for hexagon in self.hexagon_list for x, _ in hexagon.coords)
+        self.width = self.max_x - self.min_x
+        self.height = self.max_y - self.min_y
 
     @property
-    def min_y(self):
-        return min(y for hexagon in self.hexagon_list for _, y in hexagon.coords)
+    def x0(self):
+        return self.hexagon_list[0].x0
 
     @property
-    def max_y(self):
-        return max(y for hexagon in self.hexagon_list for _, y in hexagon.coords)
+    def y0(self):
+        return self.hexagon_list[0].y0
 
     @property
     def color(self):
@@ -167,84 +267,154 @@ class Figure:
         return any(hexagon.collide(x, y) for hexagon in self.hexagon_list)
 
     def draw(self, surface):
-        for hexagon in self.hexagon_list:
-            hexagon.draw(surface)
+        surface.blits([hexagon.get_blit() for hexagon in self.hexagon_list], False)
+
+    def get_rect(self):
+        rects = [hexagon.get_rect() for hexagon in self.hexagon_list]
+        return rects[0].unionall(rects[1:])
 
     def offset(self, delta_x, delta_y):
         for hexagon in self.hexagon_list:
             hexagon.offset(delta_x, delta_y)
+        self.min_x, self.max_x = self.min_x + delta_x, self.max_x + delta_x
+        self.min_y, self.max_y = self.min_y + delta_y, self.max_y + delta_y
+
+    def move_to(self, position):
+        """Метод перемещает фигуру так, чтобы центр её первого гекса оказался в переданной точке"""
+        self.offset(position[0] - self.x0, position[1] - self.y0)
 
     def scale(self, factor):
+        self.current_scale = factor
         for hexagon in self.hexagon_list:
             hexagon.scale(factor)
+        self._update_bounds()
 
-    def start_scale_process(self, target_scale, step_scale):
-        for hexagon in self.hexagon_list:
-            hexagon.start_scale_process(target_scale, step_scale)
+    def set_spacing(self, spacing):
+        """Метод изменяет расстояние между гексами фигуры в spacing раз от исходного. Первый гекс остается на месте"""
+        self.spacing = spacing
+        x0, y0 = self.x0, self.y0
+        for hexagon, (delta_x, delta_y) in zip(self.hexagon_list, self.offsets):
+            hexagon.x0, hexagon.y0 = x0 + delta_x * spacing, y0 + delta_y * spacing
+        self._update_bounds()
+
+    def start_scale_process(self, target_scale, speed):
+        duration = abs(target_scale - self.current_scale) / speed
+        animator.add(self, Figure.scale, self.current_scale, target_scale, duration)
 
     def start_offset_process(self, dx, dy):
-        for hexagon in self.hexagon_list:
-            hexagon.start_offset_process(dx, dy)
+        target = self.x0 + dx, self.y0 + dy
+        duration = get_distance(self.x0, self.y0, *target) / self.MOTION_SPEED
+        animator.add(self, Figure.move_to, (self.x0, self.y0), target, duration)
+
+    def stop_processes(self):
+        animator.cancel(self)
 
     def has_process(self):
-        return any(hexagon.has_process() for hexagon in self.hexagon_list)
+        return animator.is_active(self)
+
+    def _update_bounds(self):
+        half_width, half_height = get_hexagon_extents(round(self.current_scale / SCALE_STEP))
+        min_dx, max_dx, min_dy, max_dy = (bound * self.spacing for bound in self.centers_bounds)
+        self.min_x, self.max_x = self.x0 + min_dx - half_width, self.x0 + max_dx + half_width
+        self.min_y, self.max_y = self.y0 + min_dy - half_height, self.y0 + max_dy + half_height
 
     def __len__(self):
         return len(self.hexagon_list)
 
 
-class Pool:
-    BORDER = 10
+class FigureFactory:
+    """Класс создает фигуры по данным из FIGURES_DATA и повторно использует фигуры, которые больше не нужны"""
+
+    def __init__(self):
+        self.free_lists = [[] for _ in FIGURES_DATA]
+
+        # Создаем по одной фигуре каждого вида, чтобы определить их габариты. Сами фигуры пойдут в работу
+        self.sizes = []
+        for shape_index in range(len(FIGURES_DATA)):
+            figure = self._build(shape_index)
+            self.sizes.append((figure.width, figure.height))
+            self.free_lists[shape_index].append(figure)
+
+    def create(self, shape_index, color_index):
+        free_list = self.free_lists[shape_index]
+        figure = free_list.pop() if free_list else self._build(shape_index)
+        figure.set_spacing(1)
+        figure.scale(1)
+        figure.color_index = color_index
+        figure.color = COLOR_PRESETS[color_index]
+        return figure
+
+    def release(self, figure):
+        """Метод принимает фигуру, которая больше не нужна, для повторного использования"""
+        figure.stop_processes()
+        self.free_lists[figure.shape_index].append(figure)
+
+    @staticmethod
+    def _build(shape_index):
+        hexagon_list = []
+        x0 = y0 = 0
+        last_hexagon = FigureHexagon(x0, y0)
+        hexagon_list.append(last_hexagon)
+
+        for direction in FIGURES_DATA[shape_index]:
+            alpha = pi / 3 + direction * (pi / 3)
+            last_hexagon = FigureHexagon(
+                last_hexagon.x0 + 2 * NORMAL * cos(alpha),
+                last_hexagon.y0 - 2 * NORMAL * sin(alpha)
+            )
+            hexagon_list.append(last_hexagon)
 
-    def __init__(self, sc):
-        self.sc = sc
-        self.figures_pool = []
+        return Figure(hexagon_list, FIGURES_DATA[shape_index], shape_index)
 
-        # Генерируем все виды фигур
-        for figure_data in FIGURES_DATA:
-            hexagon_list = []
-            x0 = y0 = 0
-            last_hexagon = FigureHexagon(x0, y0)
-            hexagon_list.append(last_hexagon)
 
-            for direction in figure_data:
-                alpha = pi / 3 + direction * (pi / 3)
-                last_hexagon = FigureHexagon(
-                    last_hexagon.x0 + 2 * NORMAL * cos(alpha),
-                    last_hexagon.y0 - 2 * NORMAL * sin(alpha)
-                )
-                hexagon_list.append(last_hexagon)
+class Pool:
+    BORDER = 10
 
-            figure = Figure(hexagon_list, figure_data)
-            self.figures_pool.append(figure)
+    def __init__(self, sc, figure_pool=None):
+        self.sc = sc
+        self.figure_pool = figure_pool if figure_pool else FigurePool()
+        self.factory = FigureFactory()
 
         # Определяем максимальные габариты фигур
-        self.slot_width = max(figure.width for figure in self.figures_pool)
-        self.slot_height = max(figure.height for figure in self.figures_pool)
+        self.slot_width = max(width for width, _ in self.factory.sizes)
+        self.slot_height = max(height for _, height in self.factory.sizes)
 
+        # Слоты располагаются столбцом по центру правого края окна
+        top = (H - self.slot_height * POOL_SIZE - self.BORDER * (POOL_SIZE - 1)) // 2
         self.slots = []
-        for index in range(3):
+        for index in range(POOL_SIZE):
             self.slots.append({
                 'x': W - self.BORDER - self.slot_width,
-                'y': (H - self.slot_height * 3 - self.BORDER * 2) // 2 + index * (self.slot_height + self.BORDER),
+                'y': top + index * (self.slot_height + self.BORDER),
                 'figure': None
             })
 
-        # Создаем поверхность для отрисовки
-        self.surface = pg.Surface((W, H))
-        self.surface.set_colorkey(TRANSPARENT_COLOR)
+        # Фигуры пула рисуются прямо на экране, поэтому запоминаем занятые ими на прошлом кадре области
+        self.drawn_rects = []
         self.update_flag = True
 
-        # Заполняем слоты
-        self.refresh_slots()
+        # Номер слота и содержимое слота, из которого последней взяли фигуру
+        self.taken_slot = None
+
+        # Показываем фигуры, которые уже лежат в пуле фигур. Пустые слоты заполняет refresh_slots
+        self._create_slot_figures()
 
     def refresh_slots(self):
-        """Метод проверяет слоты и если находит пустой - добавляет в него фигуру из списка заранее созданных"""
-        for slot in self.slots:
-            if slot['figure']:
+        """
+        Метод проверяет слоты и если находит пустой - добавляет в него новую фигуру.
+        Возвращает номера заполненных слотов
+        """
+        filled_slots = self.figure_pool.refill()
+        self._create_slot_figures()
+        return filled_slots
+
+    def _create_slot_figures(self):
+        """Метод создает фигуры для слотов, в которых их еще нет, по пулу фигур. Пустые слоты пула пропускаются"""
+        for slot, figure_slot in zip(self.slots, self.figure_pool.slots):
+            if slot['figure'] or not figure_slot:
                 continue
-            figure = deepcopy(random.choice(self.figures_pool))
-            figure.color = random.choice(COLOR_PRESETS)
+            shape_index, color_index = figure_slot
+            figure = self.factory.create(shape_index, color_index)
             anchor_x, anchor_y = self._get_slot_anchor_point(slot, figure)
             figure.offset(anchor_x - figure.min_x, anchor_y - figure.min_y)
             slot['figure'] = figure
@@ -254,28 +424,30 @@ class Pool:
             figure.scale(0.1)
             figure.start_scale_process(1, Hexagon.FAST_SCALE_SPEED)
 
-    def draw(self):
-        if self.update_flag:
-            self.surface.fill(TRANSPARENT_COLOR)
+    def update(self):
+        """Метод продвигает анимации фигур и возвращает список изменившихся с прошлого кадра областей экрана"""
+        if not self.update_flag:
+            return []
 
-            for slot in self.slots:
-                figure = slot['figure']
-                if not figure:
-                    continue
-                figure.draw(self.surface)
+        figures_list = self.get_current_figures_list()
+        dirty_rects = self.drawn_rects
+        self.drawn_rects = [figure.get_rect() for figure in figures_list]
+        self.update_flag = any(figure.has_process() for figure in figures_list)
+        return dirty_rects + self.drawn_rects
 
-            self.update_flag = any(slot['figure'].has_process() for slot in self.slots if slot['figure'])
-
-        self.sc.blit(self.surface, (0, 0))
+    def draw(self):
+        for figure in self.get_current_figures_list():
+            figure.draw(self.sc)
 
     def take_from_pool(self, x, y):
         """Метод отдает фигуру, если переданная точка попадает в один из её гексов"""
-        for slot in self.slots:
+        for slot_index, slot in enumerate(self.slots):
             figure = slot['figure']
             if not figure:
                 continue
             if figure.collide(x, y):
                 slot['figure'] = None
+                self.taken_slot = slot_index, self.figure_pool.take(slot_index)
                 self.update_flag = True
                 return figure
 
@@ -287,11 +459,29 @@ class Pool:
             if slot['figure']:
                 continue
             slot['figure'] = figure
+            self.figure_pool.put((figure.shape_index, figure.color_index))
 
             # Добавляем анимацию перемещения фигуры в слот
             anchor_x, anchor_y = self._get_slot_anchor_point(slot, figure)
             figure.start_offset_process(anchor_x - figure.min_x, anchor_y - figure.min_y)
             self.update_flag = True
+            return
+
+    def release(self, figure):
+        """Метод принимает размещенную на поле фигуру, чтобы использовать её повторно"""
+        self.factory.release(figure)
+
+    def sync_with_figure_pool(self):
+        """
+        Метод заново создает фигуры в слотах по состоянию пула фигур, например, после отмены хода.
+        Пул фигур при этом не пополняется
+        """
+        for slot in self.slots:
+            if slot['figure']:
+                self.release(slot['figure'])
+                slot['figure'] = None
+        self._create_slot_figures()
+        self.update_flag = True
 
     def get_current_figures_list(self):
         return [slot['figure'] for slot in self.slots if slot['figure']]
@@ -300,258 +490,689 @@ class Pool:
         return slot['x'] + self.slot_width / 2 - figure.width / 2, slot['y'] + self.slot_height / 2 - figure.height / 2
 
 
+class Camera:
+    """
+    Камера над игровым полем. Гексы поля хранят свои координаты в мировой системе, которая при масштабе 1
+    совпадает с экранной. Камера переводит мировые координаты в экранные и обратно
+    """
+
+    def __init__(self, world_rect, viewport):
+        self.world_rect = world_rect
+        self.viewport = viewport
+
+        # По умолчанию поле целиком помещается на экране, но не увеличивается сверх исходного размера
+        self.min_zoom = min(1, viewport.width / world_rect.width, viewport.height / world_rect.height)
+        self.zoom = self.min_zoom
+        self.cx, self.cy = viewport.center
+
+        # Счетчик изменений, по которому поле узнает, что его нужно перерисовать целиком
+        self.version = 0
+
+    def world_to_screen(self, x, y):
+        return (
+            self.viewport.centerx + (x - self.cx) * self.zoom,
+            self.viewport.centery + (y - self.cy) * self.zoom
+        )
+
+    def screen_to_world(self, x, y):
+        return (
+            self.cx + (x - self.viewport.centerx) / self.zoom,
+            self.cy + (y - self.viewport.centery) / self.zoom
+        )
+
+    def pan(self, delta_x, delta_y):
+        """Метод сдвигает камеру вслед за курсором, смещенным на (delta_x, delta_y) пикселей экрана"""
+        self._move_to(self.cx - delta_x / self.zoom, self.cy - delta_y / self.zoom)
+
+    def zoom_at(self, factor, x, y):
+        """Метод изменяет масштаб в factor раз так, чтобы точка поля под курсором (x, y) осталась на месте"""
+        world_x, world_y = self.screen_to_world(x, y)
+        zoom = min(CAMERA_MAX_ZOOM, max(self.min_zoom, self.zoom * factor))
+        if zoom == self.zoom:
+            return
+        self.zoom = zoom
+        self._move_to(world_x - (x - self.viewport.centerx) / zoom, world_y - (y - self.viewport.centery) / zoom)
+        self.version += 1
+
+    def get_screen_rect(self, rect):
+        """Метод возвращает область экрана, которую занимает переданная область поля"""
+        left, top = self.world_to_screen(rect.left, rect.top)
+        right, bottom = self.world_to_screen(rect.right, rect.bottom)
+        return pg.Rect(floor(left), floor(top), ceil(right) - floor(left), ceil(bottom) - floor(top))
+
+    def _move_to(self, cx, cy):
+        # Центр камеры не уходит за пределы поля
+        cx = min(self.world_rect.right, max(self.world_rect.left, cx))
+        cy = min(self.world_rect.bottom, max(self.world_rect.top, cy))
+        if (cx, cy) != (self.cx, self.cy):
+            self.cx, self.cy = cx, cy
+            self.version += 1
+
+
 class Field:
 
-    def __init__(self, sc):
+    def __init__(self, sc, board=None):
         self.sc = sc
-        self.hexagon_list = []
-
-        # Создаем центральный гекс
-        x0, y0 = W // 2, H // 2
-        center_hexagon = FieldHexagon(x0, y0, 0, 0, 0)
-        self.hexagon_list.append(center_hexagon)
-
-        # Последовательно создаем слои гексов вокруг центрального
-        delta_alpha = pi / 3
-        for layer in range(LAYERS_COUNT):
-            anchor_hexagons = []
-            alpha = 2 * pi / 6
-
-            # Генерируем список опорных гексов
-            for direction in range(6):
-                anchor_hexagons.append(FieldHexagon(
-                    center_hexagon.x0 + (2 * NORMAL * (layer + 1)) * cos(alpha),
-                    center_hexagon.y0 - (2 * NORMAL * (layer + 1)) * sin(alpha),
-                    D_PARAMS[direction]['x-axis'] * (layer + 1),
-                    D_PARAMS[direction]['y-axis'] * (layer + 1),
-                    D_PARAMS[direction]['z-axis'] * (layer + 1)
-                ))
-                alpha += delta_alpha
-
-            self.hexagon_list.extend(anchor_hexagons)
-            if layer == 0:
-                continue
-
-            # Создаем гексы между опорными
-            anchor_hexagons.append(anchor_hexagons[0])
-            for anchor_index in range(6):
-                direction = anchor_index + 2
-                if direction > 5:
-                    direction -= 6
-                hexagon1 = anchor_hexagons[anchor_index]
-                hexagon2 = anchor_hexagons[anchor_index + 1]
-                x_axis_0, y_axis_0, z_axis_0 = hexagon1.x_axis, hexagon1.y_axis, hexagon1.z_axis
-                delta_x = (hexagon2.x0 - hexagon1.x0) / (layer + 1)
-                delta_y = (hexagon2.y0 - hexagon1.y0) / (layer + 1)
-                for index in range(layer):
-                    self.hexagon_list.append(FieldHexagon(
-                        hexagon1.x0 + delta_x * (index + 1),
-                        hexagon1.y0 + delta_y * (index + 1),
-                        x_axis_0 + D_PARAMS[direction]['x-axis'] * (index + 1),
-                        y_axis_0 + D_PARAMS[direction]['y-axis'] * (index + 1),
-                        z_axis_0 + D_PARAMS[direction]['z-axis'] * (index + 1)
-                    ))
-
-        # Создаем поверхность для отрисовки
-        self.surface = pg.Surface((W, H))
-        self.surface.set_colorkey(TRANSPARENT_COLOR)
+        self.board = board if board else Board()
+        cells_count = len(self.board)
+
+        # Данные гексов хранятся в массивах поля, по элементу на гекс: центры гексов в мировых координатах
+        # и номера цветов в палитре PALETTE. Кубические координаты и занятость гексов берутся из Board.
+        # Центральный гекс располагаем в центре окна
+        self.x0, self.y0 = W // 2, H // 2
+        self.centers_x = array('d', bytes(8 * cells_count))
+        self.centers_y = array('d', bytes(8 * cells_count))
+        for number, (x_axis, z_axis) in enumerate(zip(self.board.index.x_axises, self.board.index.z_axises)):
+            delta_x, delta_y = cube_to_pixel(x_axis, z_axis)
+            self.centers_x[number] = self.x0 + delta_x
+            self.centers_y[number] = self.y0 + delta_y
+        self.color_ids = bytearray(cells_count)
+        self.hexagon_list = FieldHexagonList(self)
+        self.sync_with_board()
+
+        # Габариты поля определяем по крайним гексам
+        numbers = range(cells_count)
+        rects = [
+            self.hexagon_list[min(numbers, key=self.centers_x.__getitem__)].get_rect(),
+            self.hexagon_list[max(numbers, key=self.centers_x.__getitem__)].get_rect(),
+            self.hexagon_list[min(numbers, key=self.centers_y.__getitem__)].get_rect(),
+            self.hexagon_list[max(numbers, key=self.centers_y.__getitem__)].get_rect()
+        ]
+        self.world_rect = rects[0].unionall(rects[1:])
+        self.camera = Camera(self.world_rect, sc.get_rect())
+        self.camera_version = self.camera.version
+
+        # Положение начала мировых координат на экране и масштаб при прошлой отрисовке: по ним определяется,
+        # на сколько сдвинулась камера
+        self.camera_offset = self.camera.world_to_screen(0, 0)
+        self.camera_zoom = self.camera.zoom
+
+        # Поверхность поля совпадает с видимой частью поля на экране. При сдвиге камеры содержимое поверхности
+        # сдвигается, а перерисовываются только открывшиеся полосы. origin - точка экрана, в которой находится
+        # левый верхний угол поверхности. Поверхность создается при первой перерисовке
+        self.rect = self._get_rect()
+        self.surface = None
+        self.origin = self.rect.topleft
         self.update_flag = True
 
-        # Количество добавленных на предыдущем ходу гексов и количество удаленных на предыдущем ходу линий
-        self.last_hexagon_add_count = 0
-        self.last_line_remove_count = 0
-
-        # Данные для воспроизведения анимации
-        self.animation = []
+        # При наименьшем масштабе поле целиком помещается на экране, поэтому для него хранится готовое изображение
+        # всего поля: сдвиг камеры и возврат к этому масштабу обходятся без перерисовки гексов. Номера гексов,
+        # изменившихся, пока изображение не показывалось, запоминаются и перерисовываются при возврате
+        self.overview = None
+        self.overview_numbers = set()
+
+        # Номера гексов, которые нужно перерисовать, если поле не требует полной перерисовки
+        self.dirty_numbers = []
+
+        # Номера свободных гексов, помеченных под перетаскиваемой фигурой
+        self.marked_numbers = []
+
+        # Номер гекса, в который встал первый гекс последней размещенной фигуры
+        self.last_anchor = None
+
+        # Эффект удаления линий рисуется поверх поверхности поля, которая при этом не перерисовывается.
+        # Для каждого удаленного гекса хранятся только центр и цвет, масштаб у всех гексов эффекта общий
+        self.effect = []
+        self.effect_scale = 1
+        self.effect_blits = []
+        self.effect_rect = None
+
+    def update(self):
+        """Метод перерисовывает изменившиеся гексы и возвращает список изменившихся с прошлого кадра областей экрана"""
+        dirty_rects = []
+        if self.camera_version != self.camera.version:
+            self.camera_version = self.camera.version
+            dirty_rects.append(self.rect)
+            self._follow_camera()
+            dirty_rects.append(self.rect)
 
-    def draw(self):
         if self.update_flag:
-            self.surface.fill(TRANSPARENT_COLOR)
-            for hexagon in self.hexagon_list:
-                hexagon.draw(self.surface)
-
-            # Если нужно - отрисовываем кадр анимации
-            self.update_flag = any(hexagon.has_process() for hexagon in self.animation)
-            if self.update_flag:
-                for hexagon in self.animation:
-                    hexagon.draw(self.surface)
+            self.update_flag = False
+            self.dirty_numbers = []
+            self._redraw()
+            dirty_rects.append(self.rect)
+
+        elif self.dirty_numbers:
+            # Спрайт гекса полностью перекрывает свою прежнюю версию, поэтому очищать поверхность не нужно.
+            # Гексы за пределами поверхности отсекаются при отрисовке
+            blits = self._get_blits(self.dirty_numbers, self.origin)
+            self.surface.blits(blits, False)
+            if self.surface is not self.overview:
+                self.overview_numbers.update(self.dirty_numbers)
+            origin_x, origin_y = self._get_screen_origin()
+            for sprite, position in blits:
+                dirty_rect = self.rect.clip(pg.Rect(position, sprite.get_size()).move(origin_x, origin_y))
+                if dirty_rect:
+                    dirty_rects.append(dirty_rect)
+            self.dirty_numbers = []
+
+        dirty_rects.extend(self._update_effect())
+        return dirty_rects
 
-        self.sc.blit(self.surface, (0, 0))
+    def draw(self):
+        origin_x, origin_y = self._get_screen_origin()
+        self.sc.blit(self.surface, self.rect, self.rect.move(-origin_x, -origin_y))
+        if self.effect_blits:
+            self.sc.blits(self.effect_blits, False)
 
     def mark_hexagons_under_figure(self, figure):
-        """Метод перебирает гексы и помечает все свободные, расположенные под переданной фигурой"""
-        free_hexagons_under_figure = self._get_free_hexagons_under_figure(figure)
-        for hexagon in self.hexagon_list:
-            if not hexagon.content:
-                color_before = hexagon.color
-                if hexagon in free_hexagons_under_figure:
-                    hexagon.color = MARKED_HEXAGON_COLOR
-                else:
-                    hexagon.color = EMPTY_HEXAGON_COLOR
-                if hexagon.color != color_before:
-                    self.update_flag = True
+        """Метод помечает все свободные гексы, расположенные под переданной фигурой, и снимает прежние пометки"""
+        self._set_marked_numbers(self._get_free_numbers_under_figure(figure))
+
+    def show_hint(self, numbers):
+        """
+        Метод помечает гексы, которые займет фигура, если сделать подсказанный ход.
+        Занятые гексы пропускаются: подсказка могла быть найдена для поля до последнего хода
+        """
+        self._set_marked_numbers([number for number in numbers if self.board.is_free(number)])
 
     def put_figure(self, figure):
         """Метод принимает фигуру, пытается разместить её на игровом поле и возвращет True, если это удалось"""
-        free_hexagons_under_figure = self._get_free_hexagons_under_figure(figure)
+        free_numbers = self._get_free_numbers_under_figure(figure)
 
-        if len(free_hexagons_under_figure) < len(figure):
-            if free_hexagons_under_figure:
-                for hexagon in free_hexagons_under_figure:
-                    hexagon.color = EMPTY_HEXAGON_COLOR
-                self.update_flag = True
+        # Снимаем пометки, оставленные перетаскиванием фигуры
+        self._set_marked_numbers([])
+
+        if len(free_numbers) < len(figure):
             return False
 
-        self.last_hexagon_add_count = len(free_hexagons_under_figure)
-        for field_hexagon in free_hexagons_under_figure:
-            field_hexagon.content = True
-            field_hexagon.color = figure.color
-        self.update_flag = True
+        self.board.put(free_numbers, figure.color_index)
+        self.last_anchor = free_numbers[0]
+        for number in free_numbers:
+            self.color_ids[number] = PRESET_COLOR_ID + figure.color_index
+        self.dirty_numbers.extend(free_numbers)
         return True
 
     def refresh_field(self):
         """Метод ищет заполненные строки и удаляет их, если находит"""
-        self.last_line_remove_count = 0
-        list_for_clear = []
-        for axis in ['x_axis', 'y_axis', 'z_axis']:
-            for val in range(-LAYERS_COUNT, LAYERS_COUNT + 1):
-                tmp_hexagon_list = [hexagon for hexagon in self.hexagon_list if getattr(hexagon, axis) == val]
-                if all(hexagon.content for hexagon in tmp_hexagon_list):
-                    self.last_line_remove_count += 1
-                    list_for_clear.extend(tmp_hexagon_list)
-
-        if not list_for_clear:
+        numbers_for_clear = self.board.refresh()
+        if not numbers_for_clear:
             return
-        self.update_flag = True
 
-        # Создаем данные для анимации
-        self.animation = deepcopy(list_for_clear)
-        for hexagon in self.animation:
-            hexagon.start_scale_process(0.1, Hexagon.NORMAL_SCALE_SPEED)
+        # Запоминаем удаленные гексы для эффекта, а на поверхности поля перерисовываем их пустыми
+        self.effect = [
+            (self.centers_x[number], self.centers_y[number], PALETTE[self.color_ids[number]])
+            for number in numbers_for_clear
+        ]
+        self.effect_scale = 1
+        animator.add(self, Field.set_effect_scale, 1, 0.1, 0.9 / Hexagon.NORMAL_SCALE_SPEED)
+
+        for number in numbers_for_clear:
+            self.color_ids[number] = EMPTY_COLOR_ID
+        self.dirty_numbers.extend(numbers_for_clear)
 
-        for hexagon in list_for_clear:
-            hexagon.content = False
-            hexagon.color = EMPTY_HEXAGON_COLOR
+    def set_effect_scale(self, scale):
+        self.effect_scale = scale
 
     def check_figures_list(self, figures_list):
         """Метод проверяет список фигур и возвращает True, если хотя бы одну из них можно разместить на гровом поле"""
-        for figure in figures_list:
-            for hexagon in self.hexagon_list:
-                if hexagon.content:
-                    continue
-
-                x_axis, y_axis, z_axis = hexagon.x_axis, hexagon.y_axis, hexagon.z_axis
-                for direction in figure.data_for_create:
-                    x_axis += D_PARAMS[direction]['x-axis']
-                    y_axis += D_PARAMS[direction]['y-axis']
-                    z_axis += D_PARAMS[direction]['z-axis']
-                    next_hexagon = self._get_hexagons_for_axises(x_axis, y_axis, z_axis)
-                    if not next_hexagon or next_hexagon.content:
-                        break
-                else:
-                    return True
-        return False
+        return self.board.check_figures_list([figure.shape_index for figure in figures_list])
 
     def get_scored_data(self):
         """
         Метод возвращает количество гексов в последней размещенной на поле фигуре и
         количество удаленных при последней проверке линий
         """
-        return self.last_hexagon_add_count, self.last_line_remove_count
+        return self.board.get_scored_data()
+
+    def sync_with_board(self):
+        """Метод приводит цвета гексов в соответствие с состоянием игрового поля"""
+        self.color_ids[:] = bytes(len(self.color_ids))
+        colors = self.board.colors
+        for number in iter_bits(self.board.occupancy):
+            self.color_ids[number] = PRESET_COLOR_ID + colors[number]
+        self.marked_numbers = []
+        self.update_flag = True
+        self.overview = None
+
+    def get_anchor(self, figure):
+        """Метод возвращает номер гекса поля под первым гексом фигуры или None, если фигура за пределами поля"""
+        return self._get_number_at(figure.x0, figure.y0)
+
+    def get_hexagon_at(self, x, y):
+        """Метод возвращает гекс поля, в который попадает точка экрана, или None, если точка лежит за пределами поля"""
+        number = self._get_number_at(x, y)
+        return None if number is None else self.hexagon_list[number]
+
+    def _get_number_at(self, x, y):
+        world_x, world_y = self.camera.screen_to_world(x, y)
+        return self.board.index.get(*pixel_to_cube(world_x - self.x0, world_y - self.y0))
+
+    def _set_marked_numbers(self, numbers):
+        color_ids = self.color_ids
+        for number in self.marked_numbers:
+            if color_ids[number] == MARKED_COLOR_ID and number not in numbers:
+                color_ids[number] = EMPTY_COLOR_ID
+                self.dirty_numbers.append(number)
+        for number in numbers:
+            if color_ids[number] != MARKED_COLOR_ID:
+                color_ids[number] = MARKED_COLOR_ID
+                self.dirty_numbers.append(number)
+        self.marked_numbers = numbers
+
+    def _get_rect(self):
+        return self.camera.get_screen_rect(self.world_rect).clip(self.camera.viewport)
+
+    def _get_screen_origin(self):
+        return round(self.origin[0]), round(self.origin[1])
+
+    def _is_overview_shown(self):
+        return self.camera.zoom == self.camera.min_zoom
+
+    def _create_surface(self, size):
+        surface = pg.Surface(size)
+        surface.set_colorkey(TRANSPARENT_COLOR)
+        return surface
+
+    def _redraw(self):
+        """Метод перерисовывает поверхность поля целиком"""
+        if self._is_overview_shown():
+            if self.overview is None:
+                zoom = self.camera.zoom
+                self.overview = self._create_surface(
+                    (ceil(self.world_rect.width * zoom) + 1, ceil(self.world_rect.height * zoom) + 1)
+                )
+            self.surface = self.overview
+            self.origin = self.camera.world_to_screen(*self.world_rect.topleft)
+            self.overview_numbers = set()
+            numbers = range(len(self.board))
+        else:
+            if self.surface is None or self.surface is self.overview or self.surface.get_size() != self.rect.size:
+                self.surface = self._create_surface(self.rect.size)
+            self.origin = self.rect.topleft
+            numbers = self._get_visible_numbers(self.rect)
+        self.surface.fill(TRANSPARENT_COLOR)
+        self.surface.blits(self._get_blits(numbers, self.origin), False)
+
+    def _follow_camera(self):
+        """
+        Метод приводит поверхность поля в соответствие с новым положением камеры. При наименьшем масштабе
+        показывается готовое изображение всего поля. При сдвиге камеры на целое число пикселей содержимое поверхности
+        сдвигается и перерисовываются только открывшиеся полосы, в остальных случаях поле перерисовывается целиком
+        """
+        camera = self.camera
+        offset_x, offset_y = camera.world_to_screen(0, 0)
+        shift_x, shift_y = offset_x - self.camera_offset[0], offset_y - self.camera_offset[1]
+        zoom_changed = camera.zoom != self.camera_zoom
+        self.camera_offset, self.camera_zoom = (offset_x, offset_y), camera.zoom
+        previous_rect, self.rect = self.rect, self._get_rect()
+
+        if self._is_overview_shown():
+            if self.overview is None:
+                self.update_flag = True
+                return
+            self.origin = camera.world_to_screen(*self.world_rect.topleft)
+            if self.surface is not self.overview:
+                self.surface = self.overview
+                self.surface.blits(self._get_blits(self.overview_numbers, self.origin), False)
+                self.overview_numbers = set()
+            return
 
-    def _get_hexagons_for_axises(self, x_axis, y_axis, z_axis):
-        for hexagon in self.hexagon_list:
-            if hexagon.x_axis == x_axis and hexagon.y_axis == y_axis and hexagon.z_axis == z_axis:
-                return hexagon
-        return None
+        is_whole_shift = abs(shift_x - round(shift_x)) < 1e-6 and abs(shift_y - round(shift_y)) < 1e-6
+        if zoom_changed or self.surface is None or self.surface is self.overview or not is_whole_shift:
+            self.update_flag = True
+            return
+
+        # Часть прежней поверхности, которая после сдвига осталась в видимой части поля
+        shift_x, shift_y = round(shift_x), round(shift_y)
+        kept_rect = previous_rect.move(shift_x, shift_y).clip(self.rect)
+        if self.surface.get_size() == self.rect.size:
+            self.surface.scroll(previous_rect.x + shift_x - self.rect.x, previous_rect.y + shift_y - self.rect.y)
+        else:
+            surface = self._create_surface(self.rect.size)
+            surface.blit(
+                self.surface, (kept_rect.x - self.rect.x, kept_rect.y - self.rect.y),
+                kept_rect.move(-previous_rect.x - shift_x, -previous_rect.y - shift_y)
+            )
+            self.surface = surface
+        self.origin = self.rect.topleft
+
+        for strip in get_rect_difference(self.rect, kept_rect):
+            self.surface.set_clip(strip.move(-self.rect.x, -self.rect.y))
+            self.surface.fill(TRANSPARENT_COLOR)
+            self.surface.blits(self._get_blits(self._get_visible_numbers(strip), self.origin), False)
+        self.surface.set_clip(None)
 
-    def _get_free_hexagons_under_figure(self, figure):
+    def _get_visible_numbers(self, rect):
+        """
+        Метод возвращает номера гексов, попадающих в переданную область экрана. Гексы перебираются по рядам
+        с одинаковой x_axis
+        """
+        if rect.contains(self.camera.get_screen_rect(self.world_rect)):
+            return range(len(self.board))
+
+        left, top = self.camera.screen_to_world(*rect.topleft)
+        right, bottom = self.camera.screen_to_world(*rect.bottomright)
+        layers_count = self.board.layers_count
+        row_height = sqrt(3) * NORMAL
+
+        # Берем с запасом в один гекс, чтобы не потерять гексы, частично попадающие на экран
+        x_min = max(-layers_count, floor((self.y0 - bottom) / row_height) - 1)
+        x_max = min(layers_count, ceil((self.y0 - top) / row_height) + 1)
+        index = self.board.index
         result = []
-        for field_hexagon in self.hexagon_list:
-            if field_hexagon.content:
-                continue
-            for figure_hexagon in figure.hexagon_list:
-                if field_hexagon.collide(figure_hexagon.x0, figure_hexagon.y0):
-                    result.append(field_hexagon)
+        for x_axis in range(x_min, x_max + 1):
+            z_min = max(-layers_count, floor(((left - self.x0) / NORMAL - x_axis) / 2) - 1)
+            z_max = min(layers_count, ceil(((right - self.x0) / NORMAL - x_axis) / 2) + 1)
+            for z_axis in range(z_min, z_max + 1):
+                number = index.get(x_axis, x_axis + z_axis, z_axis)
+                if number is not None:
+                    result.append(number)
+        return result
 
+    def _get_blits(self, numbers, origin=(0, 0)):
+        """
+        Метод возвращает пары (спрайт, позиция) для отрисовки гексов поля с переданными номерами на поверхности,
+        левый верхний угол которой находится в точке экрана origin
+        """
+        camera = self.camera
+        zoom, cx, cy = camera.zoom, camera.cx, camera.cy
+        center_x, center_y = camera.viewport.centerx - origin[0], camera.viewport.centery - origin[1]
+        centers_x, centers_y, color_ids = self.centers_x, self.centers_y, self.color_ids
+        return [
+            get_hexagon_blit(
+                PALETTE[color_ids[number]], zoom,
+                center_x + (centers_x[number] - cx) * zoom, center_y + (centers_y[number] - cy) * zoom
+            )
+            for number in numbers
+        ]
+
+    def _update_effect(self):
+        """
+        Метод готовит кадр эффекта удаления линий и возвращает область экрана, объединяющую места эффекта
+        на прошлом и текущем кадрах
+        """
+        dirty_rects = [self.effect_rect] if self.effect_rect else []
+        self.effect_blits = []
+        self.effect_rect = None
+        if not animator.is_active(self):
+            self.effect = []
+            return dirty_rects
+
+        world_to_screen, scale = self.camera.world_to_screen, self.effect_scale * self.camera.zoom
+        self.effect_blits = [get_hexagon_blit(color, scale, *world_to_screen(x0, y0)) for x0, y0, color in self.effect]
+        rects = [pg.Rect(position, sprite.get_size()) for sprite, position in self.effect_blits]
+        self.effect_rect = rects[0].unionall(rects[1:]).clip(self.rect)
+        if self.effect_rect:
+            dirty_rects.append(self.effect_rect)
+        return [dirty_rects[0].unionall(dirty_rects[1:])] if dirty_rects else []
+
+    def _get_free_numbers_under_figure(self, figure):
+        """
+        Метод определяет гекс поля под первым гексом фигуры и возвращает номера свободных гексов, которые займет
+        фигура, если поставить её первый гекс в этот гекс. Так результат не зависит от масштаба камеры
+        """
+        anchor = self.get_anchor(figure)
+        if anchor is None:
+            return []
+
+        x_axis, y_axis, z_axis = self.board.index[anchor]
+        result = []
+        for dx, dy, dz in SHAPES_OFFSETS[figure.shape_index]:
+            number = self.board.index.get(x_axis + dx, y_axis + dy, z_axis + dz)
+            if number is not None and self.board.is_free(number):
+                result.append(number)
         return result
 
 
 class DragAndDrop:
+    # Масштаб гексов перетаскиваемой фигуры относительно гексов поля
+    DRAG_SCALE = 0.8
 
     def __init__(self, sc, pool, field):
         self.sc = sc
         self.pool = pool
         self.field = field
         self.figure = None
-        self.surface = pg.Surface((W, H))
-        self.surface.set_colorkey(TRANSPARENT_COLOR)
+        self.drawn_rect = None
         self.update_flag = True
 
+        # Смещение курсора, накопленное с прошлого кадра. Фигура сдвигается на него один раз за кадр
+        self.motion_x = self.motion_y = 0
+
+        # Гекс поля под первым гексом фигуры, для которого помечены гексы под фигурой
+        self.anchor = None
+
+        # Точка, за которую взяли фигуру, относительно центра первого гекса при исходном расстоянии между гексами
+        self.grab_x = self.grab_y = 0
+
     def take(self, x, y):
         self.figure = self.pool.take_from_pool(x, y)
         if self.figure:
-            self.figure.scale(0.8)
+            self.figure.stop_processes()
+            self.grab_x = (x - self.figure.x0) / self.figure.spacing
+            self.grab_y = (y - self.figure.y0) / self.figure.spacing
+            self.motion_x = self.motion_y = 0
+            self.anchor = None
             self.update_flag = True
+            self._fit_to_camera()
 
     def drag(self, delta_x, delta_y):
+        """Метод только накапливает смещение: все события перемещения мыши за кадр применяются вместе в apply_motion"""
         if not self.figure:
             return
-        self.field.mark_hexagons_under_figure(self.figure)
-        self.figure.offset(delta_x, delta_y)
+        self.motion_x += delta_x
+        self.motion_y += delta_y
         self.update_flag = True
 
     def drop(self):
         if not self.figure:
             return
 
+        # Фигура должна оказаться там, где её отпустили, даже если кадр еще не отрисован
+        self.apply_motion()
         put_result = self.field.put_figure(self.figure)
-        if not put_result:
+        if put_result:
+            self.pool.release(self.figure)
+        else:
+            self.figure.set_spacing(1)
             self.figure.scale(1)
             self.pool.put_to_pool(self.figure)
 
         self.figure = None
+        self.anchor = None
         self.update_flag = True
         return put_result
 
+    def update(self):
+        """Метод возвращает старую и новую области, занятые перетаскиваемой фигурой"""
+        if not self.update_flag:
+            return []
+
+        dirty_rects = [self.drawn_rect] if self.drawn_rect else []
+        self.drawn_rect = self.figure.get_rect() if self.figure else None
+        if self.drawn_rect:
+            dirty_rects.append(self.drawn_rect)
+        self.update_flag = False
+        return dirty_rects
+
     def draw(self):
-        if self.update_flag:
-            self.surface.fill(TRANSPARENT_COLOR)
-            if self.figure:
-                self.figure.draw(self.surface)
-            self.update_flag = False
+        if self.figure:
+            self.figure.draw(self.sc)
 
-        self.sc.blit(self.surface, (0, 0))
+    def apply_motion(self):
+        """
+        Метод сдвигает фигуру на накопленное смещение и помечает гексы под ней, только если фигура встала над
+        другим гексом поля. Вызывается один раз за кадр после обработки событий
+        """
+        if not self.figure:
+            return
+        if self.motion_x or self.motion_y:
+            self.figure.offset(self.motion_x, self.motion_y)
+            self.motion_x = self.motion_y = 0
+        self._fit_to_camera()
+        anchor = self.field.get_anchor(self.figure)
+        if anchor != self.anchor:
+            self.anchor = anchor
+            self.field.mark_hexagons_under_figure(self.figure)
+
+    def _fit_to_camera(self):
+        """
+        Метод приводит размер фигуры и расстояние между её гексами к масштабу камеры, чтобы гексы фигуры лежали
+        над теми гексами поля, которые она займет. Точка, за которую взяли фигуру, остается на месте
+        """
+        figure, zoom = self.figure, self.field.camera.zoom
+        if figure.spacing == zoom and figure.current_scale == self.DRAG_SCALE * zoom:
+            return
+        grab_x, grab_y = figure.x0 + self.grab_x * figure.spacing, figure.y0 + self.grab_y * figure.spacing
+        figure.set_spacing(zoom)
+        figure.scale(self.DRAG_SCALE * zoom)
+        figure.move_to((grab_x - self.grab_x * zoom, grab_y - self.grab_y * zoom))
+        self.update_flag = True
+
+
+class ProfilerOverlay:
+    """Панель с временем кадра и самыми долгими этапами. Используется только при включенном профилировании"""
+    BORDER = 10
+    PADDING = 6
+    REFRESH_PERIOD = 500
+    LINES_COUNT = 10
+    TEXT_COLOR = (255, 255, 255)
+    WARNING_COLOR = (255, 90, 90)
+    BACKGROUND_COLOR = (0, 0, 0, 170)
+
+    def __init__(self, sc, profiler):
+        self.sc = sc
+        self.profiler = profiler
+        self.font = pg.font.Font(None, 22)
+        self.surface = None
+        self.rect = None
+        self.last_refresh = 0
+
+    def update(self):
+        """Метод раз в REFRESH_PERIOD миллисекунд перерисовывает панель и возвращает занятые ею области"""
+        now = pg.time.get_ticks()
+        if self.surface and now - self.last_refresh < self.REFRESH_PERIOD:
+            return []
+        self.last_refresh = now
+
+        budget = 1000 / FPS
+        frame_percentiles = self.profiler.get_percentiles('frame')
+        lines = [(
+            'frame: p50 {:.1f} / p95 {:.1f} / p99 {:.1f} ms, budget {:.1f} ms'.format(*frame_percentiles, budget),
+            self.WARNING_COLOR if frame_percentiles[1] > budget else self.TEXT_COLOR
+        )]
+        names = sorted(
+            (name for name in self.profiler.samples if name != 'frame'),
+            key=lambda name: self.profiler.get_percentiles(name, (95,))[0],
+            reverse=True
+        )
+        for name in names[:self.LINES_COUNT]:
+            lines.append((
+                '{}: p50 {:.2f} / p95 {:.2f} / p99 {:.2f} ms'.format(name, *self.profiler.get_percentiles(name)),
+                self.TEXT_COLOR
+            ))
+
+        text_surfaces = [self.font.render(text, True, color) for text, color in lines]
+        width = max(surface.get_width() for surface in text_surfaces) + 2 * self.PADDING
+        height = sum(surface.get_height() for surface in text_surfaces) + 2 * self.PADDING
+        self.surface = pg.Surface((width, height), pg.SRCALPHA)
+        self.surface.fill(self.BACKGROUND_COLOR)
+        y = self.PADDING
+        for surface in text_surfaces:
+            self.surface.blit(surface, (self.PADDING, y))
+            y += surface.get_height()
+
+        dirty_rects = [self.rect] if self.rect else []
+        self.rect = pg.Rect(self.BORDER, H - height - self.BORDER, width, height)
+        dirty_rects.append(self.rect)
+        return dirty_rects
+
+    def draw(self):
+        self.sc.blit(self.surface, self.rect)
 
 
 class Tab:
     BORDER = 10
 
+    # Длительность анимации набора очков в секундах, не зависящая от количества набранных очков
+    COUNT_DURATION = 0.5
+
     def __init__(self, sc):
         self.sc = sc
         self.font = pg.font.Font(None, 48)
-        self.surface = pg.Surface((W, H))
-        self.surface.set_colorkey(TRANSPARENT_COLOR)
+
+        # Цифры и неизменные части сообщений отрисовываем один раз, а затем только собираем из них текст
+        self.glyphs = {digit: self.font.render(digit, True, FONT_COLOR) for digit in '0123456789'}
+        self.fragments = {}
+
+        self.blit_list = []
+        self.rect = None
         self.score = 0
         self.target_score = 0
         self.msg_template = '{SCORE}'
         self.update_flag = True
 
     def update_score(self, hexagon_count, line_count):
-        self.target_score = self.score + hexagon_count + ((10 + 10 * line_count) / 2) * line_count
+        self.target_score += get_score_increment(hexagon_count, line_count)
+        animator.add(self, Tab.set_score, self.score, self.target_score, self.COUNT_DURATION)
+
+    def set_score(self, score):
+        self.score = score
         self.update_flag = True
 
     def set_final_text(self):
         self.msg_template = 'Game Over. Your score: {SCORE}. Press any key to new game...'
         self.update_flag = True
 
+    def reset(self, score):
+        """Метод сразу, без анимации, показывает переданный счет, например, после отмены хода"""
+        animator.cancel(self)
+        self.score = self.target_score = score
+        self.msg_template = '{SCORE}'
+        self.update_flag = True
+
+    def update(self):
+        """Метод обновляет текст и возвращает старую и новую области, занятые текстом"""
+        if not self.update_flag:
+            return []
+
+        prefix, suffix = self._get_fragments(self.msg_template)
+        surfaces = [prefix] + [self.glyphs[digit] for digit in str(int(self.score))] + [suffix]
+        width = sum(surface.get_width() for surface in surfaces)
+        height = max(surface.get_height() for surface in surfaces)
+
+        dirty_rects = [self.rect] if self.rect else []
+        self.rect = pg.Rect(W // 2 - width // 2, self.BORDER, width, height)
+        dirty_rects.append(self.rect)
+
+        self.blit_list = []
+        x = self.rect.x
+        for surface in surfaces:
+            self.blit_list.append((surface, (x, self.rect.y)))
+            x += surface.get_width()
+
+        self.update_flag = False
+        return dirty_rects
+
     def draw(self):
-        if self.update_flag:
-            if self.score < self.target_score:
-                self.score += 1
-            self.surface = self.font.render(self.msg_template.format(SCORE=self.score), True, FONT_COLOR)
-            self.update_flag = (self.score < self.target_score)
-
-        surface_rect = self.surface.get_rect()
-        x, y = W // 2 - surface_rect.width // 2, self.BORDER
-        self.sc.blit(self.surface, (x, y))
+        self.sc.blits(self.blit_list, False)
+
+    def _get_fragments(self, msg_template):
+        """Метод возвращает отрисованные части сообщения до и после количества очков"""
+        if msg_template not in self.fragments:
+            prefix, suffix = msg_template.split('{SCORE}')
+            self.fragments[msg_template] = (
+                self.font.render(prefix, True, FONT_COLOR),
+                self.font.render(suffix, True, FONT_COLOR)
+            )
+        return self.fragments[msg_template]
+
+
+def render(sc, layers, full_redraw=False):
+    """Функция перерисовывает только изменившиеся с прошлого кадра области экрана"""
+    dirty_rects = []
+    for layer in layers:
+        dirty_rects.extend(layer.update())
+    if full_redraw:
+        dirty_rects = [sc.get_rect()]
+    if not dirty_rects:
+        return
+
+    # Каждую область собираем заново из всех слоев, начиная с фона
+    for rect in dirty_rects:
+        sc.set_clip(rect)
+        for layer in layers:
+            layer.draw()
+    sc.set_clip(None)
+    pg.display.update(dirty_rects)
@@ -0,0 +1,441 @@
+"""Правила игры Hexagon без привязки к pygame: игровое поле, пул фигур, подсчет очков и проверка окончания игры"""
+import random
+from array import array
+from functools import lru_cache
+from settings import LAYERS_COUNT, POOL_SIZE, D_PARAMS, FIGURES_DATA, COLOR_PRESETS
+
+
+def get_score_increment(hexagon_count, line_count):
+    """Функция возвращает количество очков за размещенные гексы и удаленные линии"""
+    return hexagon_count + ((10 + 10 * line_count) / 2) * line_count
+
+
+def create_cells(layers_count):
+    """Функция возвращает список координат гексов на осях в порядке их создания: от центра к внешним слоям"""
+    cells = [(0, 0, 0)]
+    for layer in range(layers_count):
+        # Опорные гексы слоя
+        anchor_cells = [
+            (
+                D_PARAMS[direction]['x-axis'] * (layer + 1),
+                D_PARAMS[direction]['y-axis'] * (layer + 1),
+                D_PARAMS[direction]['z-axis'] * (layer + 1)
+            ) for direction in range(6)
+        ]
+        cells.extend(anchor_cells)
+        if layer == 0:
+            continue
+
+        # Гексы между опорными
+        for anchor_index in range(6):
+            direction = (anchor_index + 2) % 6
+            x_axis_0, y_axis_0, z_axis_0 = anchor_cells[anchor_index]
+            for index in range(layer):
+                cells.append((
+                    x_axis_0 + D_PARAMS[direction]['x-axis'] * (index + 1),
+                    y_axis_0 + D_PARAMS[direction]['y-axis'] * (index + 1),
+                    z_axis_0 + D_PARAMS[direction]['z-axis'] * (index + 1)
+                ))
+
+    return cells
+
+
+def get_ring_sides():
+    """
+    Функция возвращает для каждой стороны слоя поля, идущей от опорного гекса direction к следующему опорному гексу,
+    ось с постоянной вдоль стороны координатой, эту координату в первом слое, ось для отсчета положения гекса
+    на стороне, координату опорного гекса на ней в первом слое и направление отсчета
+    """
+    result = []
+    for direction in range(6):
+        anchor = [D_PARAMS[direction][axis] for axis in ('x-axis', 'y-axis', 'z-axis')]
+        step = [D_PARAMS[(direction + 2) % 6][axis] for axis in ('x-axis', 'y-axis', 'z-axis')]
+        fixed_axis = step.index(0)
+        step_axis = next(axis for axis, val in enumerate(step) if val)
+        result.append((fixed_axis, anchor[fixed_axis], step_axis, anchor[step_axis], step[step_axis]))
+    return result
+
+
+RING_SIDES = get_ring_sides()
+
+
+class CellIndex:
+    """
+    Индекс гексов игрового поля: координаты гексов на осях хранятся по столбцам, а номер гекса по координатам
+    вычисляется из порядка создания гексов в create_cells
+    """
+
+    def __init__(self, layers_count):
+        self.layers_count = layers_count
+        typecode = 'b' if layers_count < 128 else 'h'
+        cells = create_cells(layers_count)
+        self.x_axises = array(typecode, [x_axis for x_axis, _, _ in cells])
+        self.y_axises = array(typecode, [y_axis for _, y_axis, _ in cells])
+        self.z_axises = array(typecode, [z_axis for _, _, z_axis in cells])
+
+    def __len__(self):
+        return len(self.x_axises)
+
+    def __getitem__(self, number):
+        return self.x_axises[number], self.y_axises[number], self.z_axises[number]
+
+    def get(self, x_axis, y_axis, z_axis):
+        """Метод возвращает номер гекса с переданными координатами или None, если такого гекса на поле нет"""
+        layer = max(abs(x_axis), abs(y_axis), abs(z_axis))
+        if x_axis - y_axis + z_axis or layer > self.layers_count:
+            return None
+        if not layer:
+            return 0
+
+        # Слой layer начинается с шести опорных гексов, за которыми идут стороны слоя по layer - 1 гексу
+        axises = x_axis, y_axis, z_axis
+        for side, (fixed_axis, fixed_val, step_axis, anchor_val, step) in enumerate(RING_SIDES):
+            if axises[fixed_axis] != fixed_val * layer:
+                continue
+            position = (axises[step_axis] - anchor_val * layer) * step
+            if position < layer:
+                first_number = 1 + 3 * layer * (layer - 1)
+                return first_number + (6 + side * (layer - 1) + position - 1 if position else side)
+        return None
+
+    def get_neighbour(self, axises, direction):
+        """Метод возвращает номер соседнего гекса в переданном направлении или None, если гекс лежит на краю поля"""
+        x_axis, y_axis, z_axis = axises
+        return self.get(
+            x_axis + D_PARAMS[direction]['x-axis'],
+            y_axis + D_PARAMS[direction]['y-axis'],
+            z_axis + D_PARAMS[direction]['z-axis']
+        )
+
+    def get_neighbours(self, axises):
+        neighbours = (self.get_neighbour(axises, direction) for direction in range(6))
+        return [neighbour for neighbour in neighbours if neighbour is not None]
+
+    def get_lines(self):
+        """Метод возвращает все линии поля по всем трем осям: номера гексов с одинаковой координатой на оси"""
+        result = []
+        for column in (self.x_axises, self.y_axises, self.z_axises):
+            lines = {}
+            for number, val in enumerate(column):
+                lines.setdefault(val, array('I')).append(number)
+            result.extend(lines.values())
+        return result
+
+
+def get_figure_cells(index, figure_data, number):
+    """
+    Функция возвращает номера гексов, которые займет фигура, если поставить её первый гекс в гекс number,
+    или None, если фигура выходит за пределы поля
+    """
+    x_axis, y_axis, z_axis = index[number]
+    result = [number]
+    for direction in figure_data:
+        x_axis += D_PARAMS[direction]['x-axis']
+        y_axis += D_PARAMS[direction]['y-axis']
+        z_axis += D_PARAMS[direction]['z-axis']
+        next_number = index.get(x_axis, y_axis, z_axis)
+        if next_number is None:
+            return None
+        result.append(next_number)
+    return result
+
+
+def get_shape_offsets(figure_data):
+    """Функция возвращает смещения гексов фигуры на осях относительно её первого гекса"""
+    x_axis = y_axis = z_axis = 0
+    result = [(0, 0, 0)]
+    for direction in figure_data:
+        x_axis += D_PARAMS[direction]['x-axis']
+        y_axis += D_PARAMS[direction]['y-axis']
+        z_axis += D_PARAMS[direction]['z-axis']
+        result.append((x_axis, y_axis, z_axis))
+    return tuple(result)
+
+
+SHAPES_OFFSETS = [get_shape_offsets(figure_data) for figure_data in FIGURES_DATA]
+
+
+def get_distance_to_center(x_axis, y_axis, z_axis):
+    """Функция возвращает номер слоя, в котором лежит гекс (0 - центральный гекс)"""
+    return max(abs(x_axis), abs(y_axis), abs(z_axis))
+
+
+@lru_cache(maxsize=None)
+def get_placement_base(layers_count):
+    """
+    Функция возвращает для каждой фигуры массив, в котором для каждого гекса поля записано, сколько гексов фигуры
+    выйдет за пределы поля, если поставить её первый гекс в этот гекс. Размещения с ненулевым значением недоступны
+    """
+    cells = create_cells(layers_count)
+    reach = max(get_distance_to_center(*offset) for offsets in SHAPES_OFFSETS for offset in offsets)
+    result = [array('H', bytes(2 * len(cells))) for _ in SHAPES_OFFSETS]
+
+    # Фигура может выйти за пределы поля, только если её первый гекс лежит во внешних reach слоях.
+    # Гексы создаются по слоям, и слой layer начинается с гекса под номером 1 + 3 * layer * (layer - 1)
+    first_layer = layers_count - reach + 1
+    first_number = 1 + 3 * first_layer * (first_layer - 1) if first_layer > 0 else 0
+    for number in range(first_number, len(cells)):
+        x_axis, y_axis, z_axis = cells[number]
+        for shape_base, offsets in zip(result, SHAPES_OFFSETS):
+            shape_base[number] = sum(
+                get_distance_to_center(x_axis + dx, y_axis + dy, z_axis + dz) > layers_count
+                for dx, dy, dz in offsets
+            )
+    return result
+
+
+@lru_cache(maxsize=None)
+def get_cell_placements_table(layers_count):
+    """
+    Функция возвращает список, в котором для каждого гекса поля по мере надобности сохраняются размещения фигур,
+    занимающие этот гекс. Список общий для всех полей одного размера, поэтому на больших полях вычисляются
+    только размещения для гексов, которые действительно менялись
+    """
+    return [None] * len(create_cells(layers_count))
+
+
+def make_mask(numbers, size):
+    """Функция возвращает битовую маску с установленными битами под переданными номерами"""
+    buffer = bytearray((size + 7) // 8)
+    for number in numbers:
+        buffer[number >> 3] |= 1 << (number & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+# Номера установленных битов для каждого значения байта
+BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def iter_bits(mask):
+    """Функция перебирает номера установленных в маске битов"""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    for byte_index, byte in enumerate(data):
+        if byte:
+            base = byte_index * 8
+            for bit in BYTE_BITS[byte]:
+                yield base + bit
+
+
+class Board:
+    """Игровое поле. Занятость гексов хранится в виде битовой маски: каждому гексу соответствует свой бит"""
+
+    def __init__(self, layers_count=LAYERS_COUNT):
+        self.layers_count = layers_count
+        self.index = CellIndex(layers_count)
+        self.lines = self.index.get_lines()
+        self.line_masks = [make_mask(line, len(self.index)) for line in self.lines]
+        self.cell_placements = get_cell_placements_table(layers_count)
+
+        # Цвета имеют смысл только для занятых гексов, у свободных гексов номер цвета равен нулю
+        self.occupancy = 0
+        self.colors = bytearray(len(self.index))
+
+        # Для каждого размещения (фигура, гекс под её первым гексом) храним количество занятых под ним гексов,
+        # а для каждой фигуры - количество доступных размещений.
+        # Счетчики обновляются только для размещений, затронутых изменившимися гексами
+        self.blockers = []
+        self.legal_counts = []
+        self.reset_counters()
+
+        # Количество добавленных на предыдущем ходу гексов и количество удаленных на предыдущем ходу линий
+        self.last_hexagon_add_count = 0
+        self.last_line_remove_count = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def is_free(self, number):
+        return not self.occupancy >> number & 1
+
+    def get_figure_cells(self, figure_data, number):
+        return get_figure_cells(self.index, figure_data, number)
+
+    def put(self, numbers, color_index):
+        """Метод занимает переданные гексы и возвращает True, если все они были свободны"""
+        mask = make_mask(numbers, len(self.index))
+        if self.occupancy & mask:
+            return False
+
+        self.last_hexagon_add_count = len(numbers)
+        self.occupancy |= mask
+        self._update_counters(mask, 1)
+        for number in numbers:
+            self.colors[number] = color_index
+        return True
+
+    def refresh(self):
+        """Метод ищет заполненные линии, удаляет их и возвращает номера освобожденных гексов"""
+        self.last_line_remove_count = 0
+        clear_mask = 0
+        for mask in self.line_masks:
+            if self.occupancy & mask == mask:
+                self.last_line_remove_count += 1
+                clear_mask |= mask
+
+        if not clear_mask:
+            return []
+
+        self.occupancy &= ~clear_mask
+        self._update_counters(clear_mask, -1)
+        numbers = list(iter_bits(clear_mask))
+        for number in numbers:
+            self.colors[number] = 0
+        return numbers
+
+    def get_legal_placements(self, shape_index):
+        """Метод возвращает номера гексов, в которые сейчас можно поставить первый гекс фигуры"""
+        return [number for number, count in enumerate(self.blockers[shape_index]) if not count]
+
+    def can_put(self, shape_index):
+        """Метод возвращает True, если фигуру можно разместить хотя бы в одном месте поля"""
+        return self.legal_counts[shape_index] > 0
+
+    def check_figures_list(self, shape_indices):
+        """Метод возвращает True, если хотя бы одну из переданных фигур можно разместить на поле"""
+        return any(self.legal_counts[shape_index] for shape_index in shape_indices)
+
+    def reset_counters(self):
+        """Метод полностью пересчитывает счетчики размещений. Нужен после прямой записи в occupancy"""
+        self.blockers = [array('H', shape_base) for shape_base in get_placement_base(self.layers_count)]
+        self.legal_counts = [shape_blockers.count(0) for shape_blockers in self.blockers]
+        self._update_counters(self.occupancy, 1)
+
+    def set_occupancy(self, occupancy):
+        """Метод заменяет занятость гексов. Счетчики размещений обновляются только для изменившихся гексов"""
+        self._update_counters(self.occupancy & ~occupancy, -1)
+        self._update_counters(occupancy & ~self.occupancy, 1)
+        self.occupancy = occupancy
+
+    def get_cell_placements(self, number):
+        """Метод возвращает размещения, занимающие гекс: пары (номер фигуры, номер гекса под первым гексом фигуры)"""
+        cell_placements = self.cell_placements[number]
+        if cell_placements is None:
+            x_axis, y_axis, z_axis = self.index[number]
+            cell_placements = []
+            for shape_index, offsets in enumerate(SHAPES_OFFSETS):
+                for dx, dy, dz in offsets:
+                    anchor = self.index.get(x_axis - dx, y_axis - dy, z_axis - dz)
+                    if anchor is not None:
+                        cell_placements.append((shape_index, anchor))
+            cell_placements = self.cell_placements[number] = tuple(cell_placements)
+        return cell_placements
+
+    def _update_counters(self, mask, delta):
+        blockers, legal_counts = self.blockers, self.legal_counts
+        for number in iter_bits(mask):
+            for shape_index, anchor in self.get_cell_placements(number):
+                shape_blockers = blockers[shape_index]
+                before = shape_blockers[anchor]
+                shape_blockers[anchor] = before + delta
+                if before == 0:
+                    legal_counts[shape_index] -= 1
+                elif before + delta == 0:
+                    legal_counts[shape_index] += 1
+
+    def get_scored_data(self):
+        return self.last_hexagon_add_count, self.last_line_remove_count
+
+
+class FigureRandom:
+    """
+    Генератор псевдослучайных чисел SplitMix64 для пула фигур. Всё состояние генератора - одно 64-битное число,
+    поэтому оно почти ничего не добавляет к снимкам партии. Без зерна генератор начинает со случайного состояния
+    """
+    MASK = (1 << 64) - 1
+
+    def __init__(self, seed=None):
+        self.state = (random.getrandbits(64) if seed is None else seed) & self.MASK
+
+    def next(self):
+        """Метод возвращает следующее 64-битное число"""
+        self.state = state = (self.state + 0x9E3779B97F4A7C15) & self.MASK
+        state = (state ^ state >> 30) * 0xBF58476D1CE4E5B9 & self.MASK
+        state = (state ^ state >> 27) * 0x94D049BB133111EB & self.MASK
+        return state ^ state >> 31
+
+    def randrange(self, stop):
+        """Метод возвращает случайное число от 0 до stop - 1. Смещение распределения не больше stop / 2 ** 64"""
+        return self.next() * stop >> 64
+
+    def getstate(self):
+        return self.state
+
+    def setstate(self, state):
+        self.state = state
+
+
+class FigurePool:
+    """Пул фигур: каждый слот хранит пару (номер фигуры в FIGURES_DATA, номер цвета в COLOR_PRESETS)"""
+
+    def __init__(self, rng=None):
+        self.rng = rng if rng else FigureRandom()
+        self.slots = [None] * POOL_SIZE
+
+    def refill(self):
+        """Метод заполняет пустые слоты случайными фигурами и возвращает номера заполненных слотов"""
+        result = []
+        for slot_index, slot in enumerate(self.slots):
+            if slot:
+                continue
+            shape_index = self.rng.randrange(len(FIGURES_DATA))
+            color_index = self.rng.randrange(len(COLOR_PRESETS))
+            self.slots[slot_index] = shape_index, color_index
+            result.append(slot_index)
+        return result
+
+    def take(self, slot_index):
+        slot = self.slots[slot_index]
+        self.slots[slot_index] = None
+        return slot
+
+    def put(self, slot):
+        """Метод возвращает фигуру в первый свободный слот и возвращает его номер"""
+        slot_index = self.slots.index(None)
+        self.slots[slot_index] = slot
+        return slot_index
+
+    def get_shape_indices(self):
+        return [slot[0] for slot in self.slots if slot]
+
+
+class Game:
+    """
+    Игра целиком: поле, пул фигур и счет. Используется для симуляции партий без отрисовки.
+    Если передан recorder (например, replay.ReplayWriter), в него записываются все фигуры пула и ходы
+    """
+
+    def __init__(self, seed=None, layers_count=LAYERS_COUNT, recorder=None):
+        self.board = Board(layers_count)
+        self.pool = FigurePool(FigureRandom(seed))
+        self.recorder = recorder
+        self.score = 0
+        self._refill()
+
+    def put_figure(self, slot_index, number):
+        """
+        Метод размещает фигуру из слота slot_index так, чтобы её первый гекс оказался в гексе number.
+        Возвращает True, если ход удался
+        """
+        slot = self.pool.slots[slot_index]
+        if not slot:
+            return False
+        shape_index, color_index = slot
+        numbers = self.board.get_figure_cells(FIGURES_DATA[shape_index], number)
+        if not numbers or not self.board.put(numbers, color_index):
+            return False
+
+        self.pool.take(slot_index)
+        if self.recorder:
+            self.recorder.write_drop(slot_index, shape_index, number)
+        self.board.refresh()
+        self._refill()
+        self.score += get_score_increment(*self.board.get_scored_data())
+        return True
+
+    def is_over(self):
+        return not self.board.check_figures_list(self.pool.get_shape_indices())
+
+    def _refill(self):
+        for slot_index in self.pool.refill():
+            if self.recorder:
+                self.recorder.write_draw(slot_index, *self.pool.slots[slot_index])
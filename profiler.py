@@ -0,0 +1,91 @@
+"""Профилирование игрового цикла: время отдельных этапов кадра, перцентили и экспорт в формат Chrome trace"""
+import json
+from collections import deque
+from contextlib import nullcontext
+from functools import wraps
+from time import perf_counter
+
+# Пустой контекст, который возвращается вместо замера времени, если профилирование выключено
+NULL_SECTION = nullcontext()
+
+
+class Section:
+    """Контекстный менеджер, замеряющий время выполнения одного участка кода"""
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add_sample(self.name, self.start, perf_counter())
+
+
+class Profiler:
+
+    def __init__(self, enabled=False, history_size=600, trace_size=200000):
+        self.enabled = enabled
+        self.history_size = history_size
+        self.start_time = perf_counter()
+
+        # Для каждого этапа храним длительности последних history_size замеров в миллисекундах
+        self.samples = {}
+        self.trace_events = deque(maxlen=trace_size)
+
+    def section(self, name):
+        """Метод возвращает контекстный менеджер, замеряющий время выполнения кода внутри блока with"""
+        return Section(self, name) if self.enabled else NULL_SECTION
+
+    def instrument(self, obj, method_name):
+        """
+        Метод подменяет метод объекта оберткой, замеряющей время его выполнения.
+        Если профилирование выключено, объект не изменяется и никаких накладных расходов нет
+        """
+        if not self.enabled:
+            return
+        method = getattr(obj, method_name)
+        name = '{}.{}'.format(type(obj).__name__, method_name)
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.add_sample(name, start, perf_counter())
+
+        setattr(obj, method_name, wrapper)
+
+    def add_sample(self, name, start, end):
+        history = self.samples.get(name)
+        if history is None:
+            history = self.samples[name] = deque(maxlen=self.history_size)
+        history.append((end - start) * 1000)
+        self.trace_events.append((name, start, end))
+
+    def get_percentiles(self, name, percentiles=(50, 95, 99)):
+        """Метод возвращает перцентили длительности этапа в миллисекундах по последним замерам"""
+        history = sorted(self.samples.get(name, ()))
+        if not history:
+            return tuple(0 for _ in percentiles)
+        return tuple(history[min(len(history) - 1, len(history) * percentile // 100)] for percentile in percentiles)
+
+    def export_chrome_trace(self, path):
+        """Метод сохраняет замеры в формате trace event, который открывается в chrome://tracing и Perfetto"""
+        events = [
+            {
+                'name': name,
+                'ph': 'X',
+                'ts': (start - self.start_time) * 1000000,
+                'dur': (end - start) * 1000000,
+                'pid': 0,
+                'tid': 0
+            } for name, start, end in self.trace_events
+        ]
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
@@ -0,0 +1,346 @@
+"""
+Запись партий в компактный двоичный журнал и их воспроизведение: без отрисовки для проверки очков
+и в окне игры с перемоткой.
+Запуск: python replay.py verify replays/*.hxr или python replay.py view replays/<файл>.hxr
+"""
+import os
+import sys
+import struct
+import argparse
+from time import perf_counter
+from settings import FIGURES_DATA, COLOR_PRESETS
+from core import Board, FigurePool, get_score_increment
+from snapshot import take_snapshot, restore_snapshot
+
+# Журнал начинается с заголовка, за которым следуют записи: байт с типом записи и её поля.
+# Каждая запись сразу сбрасывается на диск, а незаконченная запись в конце файла при чтении пропускается,
+# поэтому при аварийном завершении теряется не больше одного хода
+MAGIC = b'HXRP'
+VERSION = 1
+HEADER = struct.Struct('<4sBHQ')
+
+# Фигура в слоте пула: номер слота, номер фигуры в FIGURES_DATA, номер цвета в COLOR_PRESETS
+RECORD_DRAW = 1
+# Ход: номер слота, номер фигуры и номер гекса поля под первым гексом фигуры
+RECORD_DROP = 2
+# Конец партии: итоговое количество очков
+RECORD_END = 3
+# Отмена последнего хода: партия возвращается в состояние перед ним
+RECORD_UNDO = 4
+
+RECORDS = {
+    RECORD_DRAW: struct.Struct('<BBB'),
+    RECORD_DROP: struct.Struct('<BBI'),
+    RECORD_END: struct.Struct('<I'),
+    RECORD_UNDO: struct.Struct('<')
+}
+
+
+class ReplayError(Exception):
+    """Исключение, возникающее при чтении поврежденного журнала или при расхождении журнала с правилами игры"""
+
+
+def read_header(replay_file):
+    """Функция читает заголовок журнала и возвращает пару (количество слоев поля, зерно генератора)"""
+    data = replay_file.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ReplayError('Журнал слишком короткий')
+    magic, version, layers_count, seed = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ReplayError('Файл не является журналом партии')
+    if version != VERSION:
+        raise ReplayError('Неподдерживаемая версия журнала: {}'.format(version))
+    return layers_count, seed
+
+
+def iter_records(replay_file):
+    """Функция перебирает записи журнала: пары (тип записи, поля записи). Незаконченная запись в конце пропускается"""
+    while True:
+        tag = replay_file.read(1)
+        if not tag:
+            return
+        record = RECORDS.get(tag[0])
+        if record is None:
+            raise ReplayError('Неизвестный тип записи: {}'.format(tag[0]))
+        data = replay_file.read(record.size)
+        if len(data) < record.size:
+            return
+        yield tag[0], record.unpack(data)
+
+
+class ReplayWriter:
+    """
+    Запись партии в журнал. Если журнал уже существует, новые записи дописываются в его конец.
+    Если передан size, журнал сначала обрезается до этого размера, например, при продолжении сохраненной партии
+    """
+
+    def __init__(self, path, layers_count, seed, size=None):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if os.path.exists(path) and os.path.getsize(path):
+            self.file = open(path, 'r+b')
+            if read_header(self.file) != (layers_count, seed):
+                self.file.close()
+                raise ReplayError('Журнал записан для другой партии')
+
+            # Отбрасываем незаконченную запись, оставшуюся после аварийного завершения
+            try:
+                complete_size = self._get_complete_size(size)
+            except ReplayError:
+                self.file.close()
+                raise
+            self.file.seek(complete_size if size is None else min(size, complete_size))
+            self.file.truncate()
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(HEADER.pack(MAGIC, VERSION, layers_count, seed))
+            self.file.flush()
+
+    def write_draw(self, slot_index, shape_index, color_index):
+        self._write(RECORD_DRAW, slot_index, shape_index, color_index)
+
+    def write_drop(self, slot_index, shape_index, number):
+        self._write(RECORD_DROP, slot_index, shape_index, number)
+
+    def write_end(self, score):
+        self._write(RECORD_END, int(score))
+
+    def write_undo(self):
+        self._write(RECORD_UNDO)
+
+    def get_size(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+    def _write(self, tag, *fields):
+        self.file.write(bytes((tag,)) + RECORDS[tag].pack(*fields))
+        self.file.flush()
+
+    def _get_complete_size(self, truncate_size=None):
+        """
+        Метод возвращает размер журнала без незаконченной записи в конце. Если передан truncate_size, метод
+        проверяет, что после этого места нет записи о конце партии: законченную партию обрезать нельзя
+        """
+        self.file.seek(HEADER.size)
+        size = HEADER.size
+        for tag, _ in iter_records(self.file):
+            if tag == RECORD_END and truncate_size is not None and size >= truncate_size:
+                raise ReplayError('Партия в журнале закончена после места сохранения')
+            size += 1 + RECORDS[tag].size
+        return size
+
+
+class ReplayPlayer:
+    """Воспроизведение журнала без отрисовки. Позиция - количество примененных записей"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as replay_file:
+            self.layers_count, self.seed = read_header(replay_file)
+            self.records = list(iter_records(replay_file))
+        self.board = Board(self.layers_count)
+        self.pool = FigurePool()
+        self.score = 0
+        self.moves = 0
+        self.lines = 0
+        self.final_score = None
+        self.position = 0
+
+        # Снимки состояний перед ходами, к которым возвращают записи об отмене хода.
+        # Если в журнале нет отмен, снимки не нужны
+        self.history = []
+        self.keeps_history = any(tag == RECORD_UNDO for tag, _ in self.records)
+
+        # Позиции, на которых пул пополнен и игрок может сделать очередной ход. По ним выполняется перемотка
+        self.move_positions = []
+        for position, (tag, fields) in enumerate(self.records):
+            next_tag = self.records[position + 1][0] if position + 1 < len(self.records) else None
+            if tag in (RECORD_DRAW, RECORD_UNDO) and next_tag != RECORD_DRAW:
+                self.move_positions.append(position + 1)
+            if tag == RECORD_END:
+                self.final_score = fields[0]
+            if tag == RECORD_UNDO:
+                self.final_score = None
+        if not self.move_positions:
+            self.move_positions.append(0)
+
+    def reset(self):
+        self.board.occupancy = 0
+        self.board.colors = bytearray(len(self.board))
+        self.board.reset_counters()
+        self.pool.slots = [None] * len(self.pool.slots)
+        self.score = self.moves = self.lines = 0
+        self.position = 0
+        self.history = []
+
+    def step(self):
+        """Метод применяет следующую запись журнала и возвращает False, если записи закончились"""
+        if self.position >= len(self.records):
+            return False
+        tag, fields = self.records[self.position]
+        self.position += 1
+        if tag in (RECORD_DRAW, RECORD_DROP) and fields[0] >= len(self.pool.slots):
+            raise ReplayError('Запись {}: неизвестный слот {}'.format(self.position, fields[0]))
+
+        if tag == RECORD_DRAW:
+            slot_index, shape_index, color_index = fields
+            if shape_index >= len(FIGURES_DATA) or color_index >= len(COLOR_PRESETS):
+                raise ReplayError('Запись {}: неизвестная фигура или цвет'.format(self.position))
+            self.pool.slots[slot_index] = shape_index, color_index
+
+        elif tag == RECORD_DROP:
+            slot_index, shape_index, number = fields
+            slot = self.pool.slots[slot_index]
+            if not slot or slot[0] != shape_index:
+                raise ReplayError('Запись {}: в слоте {} нет такой фигуры'.format(self.position, slot_index))
+            numbers = self.board.get_figure_cells(FIGURES_DATA[shape_index], number)
+            snapshot = take_snapshot(self.board, self.pool, self.score) if self.keeps_history else None
+            if not numbers or not self.board.put(numbers, slot[1]):
+                raise ReplayError('Запись {}: фигуру нельзя разместить'.format(self.position))
+            self.history.append((snapshot, self.moves, self.lines))
+            self.pool.take(slot_index)
+            self.board.refresh()
+            self.score += get_score_increment(*self.board.get_scored_data())
+            self.moves += 1
+            self.lines += self.board.last_line_remove_count
+
+        elif tag == RECORD_UNDO:
+            if not self.history:
+                raise ReplayError('Запись {}: нет хода для отмены'.format(self.position))
+            snapshot, self.moves, self.lines = self.history.pop()
+            self.score = restore_snapshot(snapshot, self.board, self.pool)
+
+        return True
+
+    def seek(self, position):
+        """Метод переходит к переданной позиции. Назад воспроизведение начинается заново с начала журнала"""
+        if position < self.position:
+            self.reset()
+        while self.position < position and self.step():
+            pass
+
+    def play(self):
+        while self.step():
+            pass
+
+    def is_over(self):
+        return not self.board.check_figures_list(self.pool.get_shape_indices())
+
+
+def verify(paths):
+    """Функция воспроизводит журналы без отрисовки и сверяет полученные очки с записанными"""
+    start = perf_counter()
+    failures = 0
+    for path in paths:
+        try:
+            player = ReplayPlayer(path)
+            player.play()
+        except (OSError, ReplayError) as error:
+            print('{}: ОШИБКА {}'.format(path, error))
+            failures += 1
+            continue
+
+        status = 'OK'
+        if player.final_score is None:
+            status = 'НЕ ЗАВЕРШЕНА'
+        elif player.final_score != int(player.score):
+            status = 'РАСХОЖДЕНИЕ (записано {})'.format(player.final_score)
+            failures += 1
+        print('{}: очки {}, ходов {}, линий {} - {}'.format(
+            path, int(player.score), player.moves, player.lines, status
+        ))
+
+    elapsed = perf_counter() - start
+    games_per_second = len(paths) / elapsed if elapsed else 0
+    print('Партий: {}, за {:.2f} с ({:.0f} партий/с)'.format(len(paths), elapsed, games_per_second))
+    return failures
+
+
+def view(path):
+    """Функция показывает партию в окне игры. Стрелки - ход назад/вперед, Home/End - начало/конец, пробел - автоигра"""
+    import pygame as pg
+    from settings import W, H, WINDOW_TITLE, FPS, CAMERA_ZOOM_STEP
+    from classes import Background, Field, Pool, Tab, render
+    from animation import animator
+
+    player = ReplayPlayer(path)
+    pg.init()
+    sc = pg.display.set_mode((W, H))
+    pg.display.set_caption('{} - {}'.format(WINDOW_TITLE, os.path.basename(path)))
+    clock = pg.time.Clock()
+
+    background = Background(sc)
+    field = Field(sc, player.board)
+    pool = Pool(sc, player.pool)
+    tab = Tab(sc)
+    move_index = 0
+    autoplay = False
+    full_redraw = True
+    synced = False
+    next_autoplay_time = 0
+
+    while True:
+        for event in pg.event.get():
+            if event.type == pg.QUIT:
+                pg.quit()
+                return
+            if event.type == pg.KEYDOWN:
+                if event.key == pg.K_RIGHT:
+                    move_index += 1
+                elif event.key == pg.K_LEFT:
+                    move_index -= 1
+                elif event.key == pg.K_HOME:
+                    move_index = 0
+                elif event.key == pg.K_END:
+                    move_index = len(player.move_positions) - 1
+                elif event.key == pg.K_SPACE:
+                    autoplay = not autoplay
+            if event.type == pg.MOUSEWHEEL:
+                field.camera.zoom_at(CAMERA_ZOOM_STEP ** event.y, *pg.mouse.get_pos())
+            if event.type == pg.MOUSEMOTION and event.buttons[2]:
+                field.camera.pan(*event.rel)
+
+        if autoplay and pg.time.get_ticks() >= next_autoplay_time:
+            move_index += 1
+            next_autoplay_time = pg.time.get_ticks() + 500
+
+        move_index = max(0, min(len(player.move_positions) - 1, move_index))
+        position = player.move_positions[move_index]
+        if position != player.position or not synced:
+            # После перемотки состояние поля и пула берем из проигрывателя
+            player.seek(position)
+            animator.clear()
+            field.sync_with_board()
+            pool.sync_with_figure_pool()
+            synced = True
+            tab.reset(player.score)
+            if move_index == len(player.move_positions) - 1 and player.is_over():
+                tab.set_final_text()
+            full_redraw = True
+
+        animator.update(clock.get_time() / 1000)
+        render(sc, [background, field, pool, tab], full_redraw)
+        full_redraw = False
+        clock.tick(FPS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка и просмотр записанных партий')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    verify_parser = subparsers.add_parser('verify', help='воспроизвести партии без отрисовки и сверить очки')
+    verify_parser.add_argument('paths', nargs='+')
+    view_parser = subparsers.add_parser('view', help='показать партию в окне игры')
+    view_parser.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'verify':
+        sys.exit(1 if verify(args.paths) else 0)
+    view(args.path)
+
+
+if __name__ == '__main__':
+    main()
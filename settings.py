@@ -1,8 +1,5 @@
 from math import pi, cos
 
-# Импорт pygame добавлен сюда, чтобы избежать циклического импорта в других модулях
-import pygame as pg
-
 # Параметры окна
 WINDOW_TITLE = 'Hexagon'
 W, H = 1400, 900
@@ -10,9 +7,24 @@ W, H = 1400, 900
 # Частота ткадров
 FPS = 30
 
+# Профилирование игрового цикла: замеры выводятся поверх игры и сохраняются в файл при выходе
+PROFILING = False
+PROFILING_TRACE_FILE = 'trace.json'
+
 # Цветовой диапазон для отрисовки фона
 BACKGROUND_COLORS_RANGE = (240, 250)
 
+# Зерно генератора фона. Если оно задано, то фон сохраняется на диск и при следующих запусках загружается оттуда
+BACKGROUND_SEED = None
+BACKGROUND_CACHE_DIR = 'cache'
+
+# Папка, в которую записываются журналы партий
+REPLAY_DIR = 'replays'
+
+# Файл сохраненной партии и количество ходов, которые можно отменить
+SAVE_FILE = 'save.hxs'
+UNDO_DEPTH = 100
+
 # Параметры отдельных гексов
 RADIUS = 45
 NORMAL = RADIUS * cos(pi / 6)
@@ -22,8 +34,30 @@ HEX_MARGIN = 3
 SMOOTH_FACTOR = 0.15
 SMOOTH_DEPTH = 1
 
+# Шаг, с которым округляется масштаб гексов, и количество хранимых в кэше вариантов геометрии гекса
+SCALE_STEP = 0.01
+HEXAGON_CACHE_SIZE = 256
+
+# Количество хранимых в кэше заранее отрисованных гексов
+SPRITE_CACHE_SIZE = 512
+
+# Параметры камеры над игровым полем: максимальное приближение и шаг изменения масштаба колесом мыши
+CAMERA_MAX_ZOOM = 2
+CAMERA_ZOOM_STEP = 1.1
+
+# Радиус гекса на экране, меньше которого гексы рисуются упрощенно: без сглаживания углов и рамки
+LOD_RADIUS = 12
+
+# Время на поиск лучшего хода в секундах и количество хранимых в кэше оценок полей и результатов перебора
+SOLVER_TIME_BUDGET = 0.01
+SOLVER_TABLE_SIZE = 100000
+
+# Время на поиск подсказки в секундах. Подсказка ищется в фоновом процессе, поэтому время может быть больше кадра
+HINT_TIME_BUDGET = 0.25
+
 # Параметры игрового поля
 LAYERS_COUNT = 4
+POOL_SIZE = 3
 EMPTY_HEXAGON_COLOR = (220, 220, 220)
 MARKED_HEXAGON_COLOR = (180, 180, 180)
 
@@ -37,6 +71,9 @@ D_PARAMS = [
     {'x-axis': 0, 'y-axis': 1, 'z-axis': 1},
 ]
 
+# Оси, по которым на игровом поле выстраиваются линии
+D_AXISES = ('x_axis', 'y_axis', 'z_axis')
+
 # Цвет, который будет использоваться как прозрачный при создании поверхностей
 TRANSPARENT_COLOR = (0, 0, 0)
 
@@ -0,0 +1,238 @@
+"""
+Снимки состояния партии: занятость и цвета гексов поля, слоты пула, счет и состояние генератора фигур.
+Снимок - короткая строка байтов, поэтому его можно делать после каждого хода для отмены ходов, сохранять на диск,
+чтобы продолжить партию позже, и использовать при переборе ходов.
+Проверка отмены ходов и замер скорости: python snapshot.py --check
+"""
+import os
+import sys
+import random
+import struct
+import argparse
+from collections import deque
+from time import perf_counter
+from settings import LAYERS_COUNT, POOL_SIZE, UNDO_DEPTH
+from core import Board, Game, iter_bits
+
+# Снимок начинается с заголовка (в том числе счета), за которым следуют слоты пула, состояние генератора фигур,
+# битовая маска занятости гексов и номера цветов занятых гексов в порядке их номеров
+MAGIC = b'HXSN'
+VERSION = 2
+HEADER = struct.Struct('<4sBHd')
+
+# Слот пула: номер фигуры и номер цвета. Пустой слот записывается как пара EMPTY_SLOT
+SLOTS = struct.Struct('<{}B'.format(2 * POOL_SIZE))
+EMPTY_SLOT = 255
+
+# Состояние генератора фигур core.FigureRandom
+RNG_STATE = struct.Struct('<Q')
+
+# Файл сохраненной партии: заголовок, путь к журналу партии, снимок. Размер журнала на момент сохранения
+# нужен, чтобы при продолжении партии отбросить ходы, сделанные после сохранения
+SAVE_MAGIC = b'HXSV'
+SAVE_VERSION = 1
+SAVE_HEADER = struct.Struct('<4sBQH')
+
+
+class SnapshotError(Exception):
+    """Исключение, возникающее при чтении поврежденного снимка или снимка для поля другого размера"""
+
+
+def get_occupancy_size(cells_count):
+    return (cells_count + 7) // 8
+
+
+def take_snapshot(board, figure_pool, score):
+    """Функция возвращает снимок состояния партии"""
+    slots = []
+    for slot in figure_pool.slots:
+        slots.extend(slot if slot else (EMPTY_SLOT, EMPTY_SLOT))
+    occupancy = board.occupancy
+    return b''.join((
+        HEADER.pack(MAGIC, VERSION, board.layers_count, score),
+        SLOTS.pack(*slots),
+        RNG_STATE.pack(figure_pool.rng.getstate()),
+        occupancy.to_bytes(get_occupancy_size(len(board)), 'little'),
+        bytes(map(board.colors.__getitem__, iter_bits(occupancy)))
+    ))
+
+
+def get_layers_count(data):
+    """Функция проверяет заголовок снимка и возвращает количество слоев поля, для которого он сделан"""
+    if len(data) < HEADER.size:
+        raise SnapshotError('Снимок слишком короткий')
+    magic, version, layers_count, _ = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError('Данные не являются снимком партии')
+    if version != VERSION:
+        raise SnapshotError('Неподдерживаемая версия снимка: {}'.format(version))
+    return layers_count
+
+
+def restore_snapshot(data, board, figure_pool):
+    """
+    Функция восстанавливает состояние поля и пула из снимка и возвращает счет.
+    Счетчики размещений поля пересчитываются только для гексов, занятость которых изменилась
+    """
+    if get_layers_count(data) != board.layers_count:
+        raise SnapshotError('Снимок сделан для поля другого размера')
+    occupancy_size = get_occupancy_size(len(board))
+    offset = HEADER.size + SLOTS.size + RNG_STATE.size
+    if len(data) < offset + occupancy_size:
+        raise SnapshotError('Снимок слишком короткий')
+
+    score = HEADER.unpack_from(data)[3]
+    slots = SLOTS.unpack_from(data, HEADER.size)
+    rng_state, = RNG_STATE.unpack_from(data, HEADER.size + SLOTS.size)
+    occupancy = int.from_bytes(data[offset:offset + occupancy_size], 'little')
+    colors = data[offset + occupancy_size:]
+    numbers = list(iter_bits(occupancy))
+    if len(colors) != len(numbers) or occupancy >> len(board):
+        raise SnapshotError('Занятость гексов не совпадает с их цветами')
+
+    board.set_occupancy(occupancy)
+    board.colors = bytearray(len(board))
+    for number, color_index in zip(numbers, colors):
+        board.colors[number] = color_index
+    figure_pool.slots = [
+        None if shape_index == EMPTY_SLOT else (shape_index, color_index)
+        for shape_index, color_index in zip(slots[0::2], slots[1::2])
+    ]
+    figure_pool.rng.setstate(rng_state)
+    return score
+
+
+class History:
+    """Снимки состояний перед последними ходами для многоуровневой отмены. Хранится не больше depth снимков"""
+
+    def __init__(self, depth=UNDO_DEPTH):
+        self.snapshots = deque(maxlen=depth)
+
+    def push(self, data):
+        self.snapshots.append(data)
+
+    def pop(self):
+        """Метод возвращает снимок состояния перед последним ходом или None, если отменять нечего"""
+        return self.snapshots.pop() if self.snapshots else None
+
+    def clear(self):
+        self.snapshots.clear()
+
+    def __len__(self):
+        return len(self.snapshots)
+
+
+def save_game(path, data, replay_path, replay_size):
+    """Функция сохраняет снимок партии на диск. Файл заменяется целиком, поэтому сбой не испортит прежнее сохранение"""
+    encoded_path = replay_path.encode()
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as save_file:
+        save_file.write(SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION, replay_size, len(encoded_path)))
+        save_file.write(encoded_path)
+        save_file.write(data)
+    os.replace(temp_path, path)
+
+
+def load_game(path):
+    """Функция читает сохраненную партию и возвращает тройку (снимок, путь к журналу, размер журнала)"""
+    with open(path, 'rb') as save_file:
+        content = save_file.read()
+    if len(content) < SAVE_HEADER.size:
+        raise SnapshotError('Файл сохранения слишком короткий')
+    magic, version, replay_size, path_size = SAVE_HEADER.unpack_from(content)
+    if magic != SAVE_MAGIC:
+        raise SnapshotError('Файл не является сохраненной партией')
+    if version != SAVE_VERSION:
+        raise SnapshotError('Неподдерживаемая версия сохранения: {}'.format(version))
+    replay_path = content[SAVE_HEADER.size:SAVE_HEADER.size + path_size].decode()
+    data = content[SAVE_HEADER.size + path_size:]
+    get_layers_count(data)
+    return data, replay_path, replay_size
+
+
+def get_state(game):
+    """Функция возвращает состояние партии в виде, удобном для сравнения"""
+    return game.board.occupancy, bytes(game.board.colors), list(game.pool.slots), game.score, game.pool.rng.getstate()
+
+
+def check_undo(games, layers_count, seed):
+    """
+    Функция играет случайные партии, делая снимок перед каждым ходом и время от времени отменяя ходы,
+    и сравнивает восстановленные состояния и счетчики размещений с исходными. Возвращает количество расхождений
+    """
+    rng = random.Random(seed)
+    mismatches = 0
+    for game_index in range(games):
+        game = Game(seed + game_index, layers_count)
+        history = History()
+        states = []
+        while not game.is_over():
+            if states and rng.random() < 0.3:
+                # Отменяем от одного до трех ходов
+                for _ in range(min(len(states), rng.randint(1, 3))):
+                    state = states.pop()
+                    game.score = restore_snapshot(history.pop(), game.board, game.pool)
+                if get_state(game) != state:
+                    mismatches += 1
+                    print('Партия {}: состояние после отмены не совпадает с исходным'.format(game_index))
+                reference = Board(layers_count)
+                reference.occupancy = game.board.occupancy
+                reference.reset_counters()
+                if reference.legal_counts != game.board.legal_counts:
+                    mismatches += 1
+                    print('Партия {}: счетчики размещений после отмены не совпадают'.format(game_index))
+                continue
+
+            history.push(take_snapshot(game.board, game.pool, game.score))
+            states.append(get_state(game))
+            moves = [
+                (slot_index, number)
+                for slot_index, slot in enumerate(game.pool.slots) if slot
+                for number in game.board.get_legal_placements(slot[0])
+            ]
+            game.put_figure(*rng.choice(moves))
+    return mismatches
+
+
+def measure_speed(layers_count, repeat):
+    """Функция возвращает количество пар снимок-восстановление в секунду для поля, заполненного наполовину"""
+    game = Game(0, layers_count)
+    rng = random.Random(0)
+    for number in range(len(game.board)):
+        if rng.random() < 0.5:
+            game.board.put([number], rng.randrange(3))
+    snapshots = [take_snapshot(game.board, game.pool, game.score)]
+    game.board.put([next(number for number in range(len(game.board)) if game.board.is_free(number))], 0)
+    snapshots.append(take_snapshot(game.board, game.pool, game.score))
+
+    # Каждый раз восстанавливаем состояние, отличающееся от текущего одним гексом, как при отмене хода
+    start = perf_counter()
+    for index in range(repeat):
+        take_snapshot(game.board, game.pool, game.score)
+        restore_snapshot(snapshots[index % 2], game.board, game.pool)
+    return repeat / (perf_counter() - start), len(snapshots[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Снимки состояния партии: проверка отмены ходов и замер скорости')
+    parser.add_argument('--check', action='store_true', help='проверить отмену ходов на случайных партиях')
+    parser.add_argument('--games', type=int, default=50, help='количество партий для проверки')
+    parser.add_argument('--layers', type=int, nargs='+', default=[LAYERS_COUNT, 20, 100], help='количество слоев поля')
+    parser.add_argument('--repeat', type=int, default=2000, help='количество повторов замера скорости')
+    parser.add_argument('--seed', type=int, default=0, help='зерно генератора')
+    args = parser.parse_args()
+
+    if args.check:
+        mismatches = check_undo(args.games, args.layers[0], args.seed)
+        print('Расхождений после отмены ходов: {}'.format(mismatches))
+        if mismatches:
+            sys.exit(1)
+    for layers_count in args.layers:
+        speed, size = measure_speed(layers_count, args.repeat)
+        print('Слоев: {}, размер снимка {} байт, снимков с восстановлением в секунду: {:.0f}'.format(
+            layers_count, size, speed
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""Поиск лучшего хода: перебор порядка и мест размещения фигур пула с учетом удаления линий между ходами"""
+from collections import OrderedDict
+from functools import lru_cache
+from time import perf_counter
+from settings import FIGURES_DATA, SOLVER_TIME_BUDGET, SOLVER_TABLE_SIZE
+from core import Board, get_score_increment, make_mask, iter_bits
+
+
+class SearchTimeout(Exception):
+    """Исключение, прерывающее поиск, когда время на ход закончилось"""
+
+
+class TranspositionTable:
+    """Ограниченный по размеру кэш результатов поиска. При переполнении вытесняются давно не использованные записи"""
+
+    def __init__(self, size=SOLVER_TABLE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+
+@lru_cache(maxsize=None)
+def get_solver_tables(layers_count):
+    """
+    Функция возвращает таблицы, общие для всех полей одного размера: для каждого гекса - номера проходящих через него
+    линий, номера его соседей и окно соседей: сдвиг маски занятости, после которого гекс и его соседи оказываются
+    в младших битах, положение гекса в окне и маска соседей в окне
+    """
+    board = Board(layers_count)
+    cell_lines = [[] for _ in range(len(board))]
+    for line_index, line in enumerate(board.lines):
+        for number in line:
+            cell_lines[number].append(line_index)
+    neighbours = [tuple(board.index.get_neighbours(board.index[number])) for number in range(len(board))]
+    windows = []
+    for number, cell_neighbours in enumerate(neighbours):
+        shift = min(number, *cell_neighbours)
+        window_neighbours = [neighbour - shift for neighbour in cell_neighbours]
+        windows.append((shift, number - shift, make_mask(window_neighbours, max(window_neighbours, default=0) + 1)))
+    return cell_lines, neighbours, windows
+
+
+class Solver:
+    # Веса эвристической оценки поля: одиночные свободные гексы и границы между свободными и занятыми гексами
+    HOLE_WEIGHT = 3
+    ROUGHNESS_WEIGHT = 0.5
+
+    # Штраф за каждую фигуру, которую не удалось разместить
+    STUCK_PENALTY = 100
+
+    def __init__(self, board, time_budget=SOLVER_TIME_BUDGET, table_size=SOLVER_TABLE_SIZE):
+        self.board = board
+        self.time_budget = time_budget
+        self.cell_lines, self.neighbours, self.windows = get_solver_tables(board.layers_count)
+
+        # Оценки полей и результаты перебора хранятся в одной таблице: ключ оценки - маска занятости поля,
+        # ключ результата перебора - маска занятости, оставшиеся фигуры и глубина перебора
+        self.table = TranspositionTable(table_size)
+
+        # Оценка поля пересчитывается только для гексов рядом с изменившимися, поэтому запоминаем оценку поля
+        # при прошлом поиске: следующий поиск начнется с поля, отличающегося от него на несколько ходов
+        self.root_occupancy = None
+        self.root_value = 0
+
+        # Гексы и маски размещений вычисляются по мере надобности: на больших полях нужна лишь малая их часть
+        self.placements = {}
+
+        self.deadline = 0
+        self.nodes = 0
+        self.completed_depth = 0
+
+    def get_best_move(self, shape_indices, time_budget=None, max_depth=None):
+        """
+        Метод ищет лучший ход для фигур с переданными номерами (None - пустой слот) и возвращает пару
+        (индекс фигуры в списке, номер гекса под первым гексом фигуры) или None, если ни одну фигуру разместить нельзя.
+        Поиск углубляется, пока не закончится время или не будет достигнута глубина max_depth,
+        и возвращает результат последней полностью просмотренной глубины
+        """
+        self.deadline = perf_counter() + (self.time_budget if time_budget is None else time_budget)
+        self.nodes = 0
+        self.completed_depth = 0
+
+        occupancy = self.board.occupancy
+        value = self._get_root_value(occupancy)
+
+        # Доступные размещения перебираются по всем гексам поля, поэтому на больших полях время проверяется и здесь.
+        # Если оно закончилось, фигуры, до которых не дошла очередь, не рассматриваются
+        legal = {}
+        for shape_index in sorted(set(shape_index for shape_index in shape_indices if shape_index is not None)):
+            if any(legal.values()) and perf_counter() > self.deadline:
+                break
+            legal[shape_index] = self.board.get_legal_placements(shape_index)
+        shapes = tuple(sorted(shape_index for shape_index in shape_indices if shape_index in legal))
+        root_moves = [(shape_index, anchor) for shape_index in sorted(legal) for anchor in legal[shape_index]]
+        if not root_moves:
+            return None
+
+        best_move = None
+        for depth in range(1, min(len(shapes), max_depth or len(shapes)) + 1):
+            ranked_moves = []
+            try:
+                for move in root_moves:
+                    ranked_moves.append((self._search_move(occupancy, value, shapes, legal, move, depth), move))
+            except SearchTimeout:
+                # Ходы, просмотренные на этой глубине до конца, сравнимы между собой. Первым всегда просматривается
+                # лучший ход предыдущей глубины, поэтому их результат не хуже уже найденного
+                if ranked_moves:
+                    best_move = max(ranked_moves, key=lambda item: item[0])[1]
+                break
+            ranked_moves.sort(key=lambda item: -item[0])
+            root_moves = [move for _, move in ranked_moves]
+            best_move = root_moves[0]
+            self.completed_depth = depth
+
+        # Если время истекло раньше, чем был просмотрен хотя бы один ход, возвращаем первый доступный
+        if best_move is None:
+            best_move = root_moves[0]
+        shape_index, anchor = best_move
+        return list(shape_indices).index(shape_index), anchor
+
+    def get_move_cells(self, shape_index, anchor):
+        return self.board.get_figure_cells(FIGURES_DATA[shape_index], anchor)
+
+    def evaluate(self, occupancy):
+        """
+        Метод возвращает эвристическую оценку поля: чем меньше одиночных дыр и неровных границ, тем лучше.
+        Оценка складывается из вкладов свободных гексов, зависящих только от самого гекса и его соседей,
+        поэтому учитываются лишь соседи занятых гексов: вклад остальных свободных гексов нулевой
+        """
+        numbers = set()
+        for number in iter_bits(occupancy):
+            numbers.update(self.neighbours[number])
+        return sum(self._get_cell_value(number, occupancy) for number in numbers)
+
+    def get_value_delta(self, occupancy, next_occupancy, changed):
+        """
+        Метод возвращает изменение оценки поля после изменения занятости гексов с номерами changed,
+        пересчитывая вклады только этих гексов и их соседей
+        """
+        affected = set(changed)
+        for number in changed:
+            affected.update(self.neighbours[number])
+        get_cell_value = self._get_cell_value
+        return sum(
+            get_cell_value(number, next_occupancy) - get_cell_value(number, occupancy) for number in affected
+        )
+
+    def apply(self, occupancy, cells, mask):
+        """
+        Метод ставит фигуру на гексы cells с маской mask и удаляет заполненные линии.
+        Возвращает новое состояние, номера гексов удаленных линий и очки
+        """
+        occupancy |= mask
+        clear_mask = 0
+        cleared = set()
+        line_count = 0
+        checked_lines = set()
+        for number in cells:
+            for line_index in self.cell_lines[number]:
+                if line_index in checked_lines:
+                    continue
+                checked_lines.add(line_index)
+                line_mask = self.board.line_masks[line_index]
+                if occupancy & line_mask == line_mask:
+                    clear_mask |= line_mask
+                    cleared.update(self.board.lines[line_index])
+                    line_count += 1
+        return occupancy & ~clear_mask, cleared, get_score_increment(len(cells), line_count)
+
+    def _get_cell_value(self, number, occupancy):
+        """Метод возвращает вклад гекса в оценку поля: свободный гекс штрафуется за каждого занятого соседа"""
+        shift, position, neighbours_mask = self.windows[number]
+        window = occupancy >> shift
+        if window >> position & 1:
+            return 0
+        occupied = bin(window & neighbours_mask).count('1')
+        return -self.HOLE_WEIGHT * (occupied == len(self.neighbours[number])) - self.ROUGHNESS_WEIGHT * occupied
+
+    def _get_root_value(self, occupancy):
+        if self.root_occupancy is None:
+            value = self.evaluate(occupancy)
+        else:
+            changed = list(iter_bits(self.root_occupancy ^ occupancy))
+            value = self.root_value + self.get_value_delta(self.root_occupancy, occupancy, changed)
+        self.root_occupancy, self.root_value = occupancy, value
+        return value
+
+    def _get_placement(self, shape_index, anchor):
+        """Метод возвращает номера гексов размещения фигуры и их маску. Если фигура не помещается на поле - (None, 0)"""
+        key = shape_index, anchor
+        placement = self.placements.get(key)
+        if placement is None:
+            cells = self.get_move_cells(shape_index, anchor)
+            placement = self.placements[key] = cells, make_mask(cells or (), len(self.board))
+        return placement
+
+    def _search_move(self, occupancy, value, shapes, legal, move, depth):
+        """
+        Метод возвращает очки за ход и лучший результат оставшихся depth - 1 ходов после него.
+        value - оценка поля occupancy
+        """
+        self.nodes += 1
+        if perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+        shape_index, anchor = move
+        cells, mask = self._get_placement(shape_index, anchor)
+        next_occupancy, cleared, increment = self.apply(occupancy, cells, mask)
+        next_value = self.table.get(next_occupancy)
+        if next_value is None:
+            next_value = value + self.get_value_delta(occupancy, next_occupancy, cleared.union(cells))
+            self.table.put(next_occupancy, next_value)
+        remaining = list(shapes)
+        remaining.remove(shape_index)
+        remaining = tuple(remaining)
+        if depth == 1 or not remaining:
+            return increment + next_value
+        next_legal = self._get_next_legal(legal, remaining, next_occupancy, cells, cleared)
+        return increment + self._search(next_occupancy, next_value, remaining, next_legal, depth - 1)
+
+    def _search(self, occupancy, value, shapes, legal, depth):
+        key = occupancy, shapes, depth
+        result = self.table.get(key)
+        if result is not None:
+            return result
+
+        for shape_index in sorted(set(shapes)):
+            for anchor in legal[shape_index]:
+                move_value = self._search_move(occupancy, value, shapes, legal, (shape_index, anchor), depth)
+                if result is None or move_value > result:
+                    result = move_value
+        if result is None:
+            result = value - self.STUCK_PENALTY * len(shapes)
+
+        self.table.put(key, result)
+        return result
+
+    def _get_next_legal(self, legal, shapes, occupancy, cells, cleared):
+        """
+        Метод возвращает доступные размещения фигур после хода: из прежних размещений убираются пересекающиеся
+        с поставленной фигурой, а для освобожденных удалением линий гексов проверяются проходящие через них размещения
+        """
+        # Размещения, пересекающиеся с поставленной фигурой, - это размещения, занимающие любой из её гексов
+        blocked = {placement for number in cells for placement in self.board.get_cell_placements(number)}
+        next_legal = {
+            shape_index: [anchor for anchor in legal[shape_index] if (shape_index, anchor) not in blocked]
+            for shape_index in set(shapes)
+        }
+        for number in cleared:
+            for shape_index, anchor in self.board.get_cell_placements(number):
+                if shape_index not in next_legal or anchor in next_legal[shape_index]:
+                    continue
+                placement_cells, placement_mask = self._get_placement(shape_index, anchor)
+                if placement_cells and not placement_mask & occupancy:
+                    next_legal[shape_index].append(anchor)
+        return next_legal
@@ -1,71 +1,227 @@
-from settings import pg, W, H, WINDOW_TITLE, FPS, GAME_MODE, FINAL_MODE
-from classes import Field, Pool, DragAndDrop, Background, Tab
-
-
-def init_new_game(sc):
-    field = Field(sc)
-    pool = Pool(sc)
+import os
+import random
+import argparse
+from time import perf_counter, strftime
+import pygame as pg
+from settings import W, H, WINDOW_TITLE, FPS, GAME_MODE, FINAL_MODE, PROFILING, PROFILING_TRACE_FILE, LAYERS_COUNT, \
+    CAMERA_ZOOM_STEP, HINT_TIME_BUDGET, REPLAY_DIR, SAVE_FILE
+from core import Board, FigurePool, FigureRandom
+from replay import ReplayWriter, ReplayError, read_header
+from snapshot import History, SnapshotError, take_snapshot, restore_snapshot, get_layers_count, save_game, load_game
+from classes import Field, Pool, DragAndDrop, Background, Tab, ProfilerOverlay, render
+from worker import Worker, get_snapshot, find_best_move
+from animation import animator
+from profiler import Profiler
+
+
+def init_new_game(sc, profiler, layers_count=LAYERS_COUNT):
+    # Каждая партия записывается в журнал: зерно генератора, все фигуры пула и все ходы
+    seed = random.getrandbits(63)
+    field, pool, drag_and_drop, tab = init_game(sc, profiler, Board(layers_count), FigurePool(FigureRandom(seed)))
+    pool.refresh_slots()
+    recorder = ReplayWriter(
+        os.path.join(REPLAY_DIR, 'replay_{}_{}.hxr'.format(strftime('%Y%m%d_%H%M%S'), seed)), layers_count, seed
+    )
+    for slot_index, slot in enumerate(pool.figure_pool.slots):
+        recorder.write_draw(slot_index, *slot)
+    return field, pool, drag_and_drop, tab, recorder
+
+
+def resume_game(sc, profiler, save_path):
+    """Функция продолжает сохраненную партию. Ходы, записанные в журнал после сохранения, отбрасываются"""
+    data, replay_path, replay_size = load_game(save_path)
+    with open(replay_path, 'rb') as replay_file:
+        layers_count, seed = read_header(replay_file)
+    if get_layers_count(data) != layers_count:
+        raise SnapshotError('Сохранение не соответствует журналу партии')
+
+    board, figure_pool = Board(layers_count), FigurePool()
+    score = restore_snapshot(data, board, figure_pool)
+    field, pool, drag_and_drop, tab = init_game(sc, profiler, board, figure_pool)
+    tab.reset(score)
+    recorder = ReplayWriter(replay_path, layers_count, seed, replay_size)
+    return field, pool, drag_and_drop, tab, recorder
+
+
+def init_game(sc, profiler, board, figure_pool):
+    field = Field(sc, board)
+    pool = Pool(sc, figure_pool)
     drag_and_drop = DragAndDrop(sc, pool, field)
     tab = Tab(sc)
+
+    # Если профилирование включено, замеряем время основных операций и отрисовки всех компонентов
+    profiler.instrument(drag_and_drop, 'apply_motion')
+    profiler.instrument(field, 'refresh_field')
+    profiler.instrument(field, 'check_figures_list')
+    profiler.instrument(pool, 'refresh_slots')
+    for component in (field, pool, drag_and_drop, tab):
+        profiler.instrument(component, 'update')
+        profiler.instrument(component, 'draw')
+
     return field, pool, drag_and_drop, tab
 
 
+def take_game_snapshot(field, pool, tab):
+    return take_snapshot(field.board, pool.figure_pool, tab.target_score)
+
+
+def restore_game(field, pool, tab, data):
+    """Функция возвращает партию к состоянию из снимка"""
+    animator.clear()
+    score = restore_snapshot(data, field.board, pool.figure_pool)
+    field.sync_with_board()
+    pool.sync_with_figure_pool()
+    tab.reset(score)
+
+
+def remove_save():
+    """Функция удаляет сохранение: законченную партию продолжить нельзя"""
+    if os.path.exists(SAVE_FILE):
+        os.remove(SAVE_FILE)
+
+
+def is_undo_key(event):
+    return event.key == pg.K_u or event.key == pg.K_z and event.mod & pg.KMOD_CTRL
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Игра Hexagon')
+    parser.add_argument('--layers', type=int, default=LAYERS_COUNT, help='количество слоев игрового поля')
+    parser.add_argument('--resume', action='store_true', help='продолжить сохраненную партию')
+    args = parser.parse_args()
+
     # Инициализируем окно
     pg.init()
     sc = pg.display.set_mode((W, H))
     pg.display.set_caption(WINDOW_TITLE)
     clock = pg.time.Clock()
 
+    profiler = Profiler(PROFILING)
+    profiler.instrument(animator, 'update')
+    overlay_layers = [ProfilerOverlay(sc, profiler)] if profiler.enabled else []
+
     background = Background(sc)
-    field, pool, drag_and_drop, tab = init_new_game(sc)
+    profiler.instrument(background, 'draw')
+    game = None
+    if args.resume and os.path.exists(SAVE_FILE):
+        try:
+            game = resume_game(sc, profiler, SAVE_FILE)
+        except (OSError, ReplayError, SnapshotError) as error:
+            print('Не удалось продолжить сохраненную партию: {}'.format(error))
+    field, pool, drag_and_drop, tab, recorder = game if game else init_new_game(sc, profiler, args.layers)
+
+    # Снимок текущего состояния партии и снимки состояний перед ходами для их отмены (клавиша U или Ctrl+Z).
+    # Текущий снимок сохраняется на диск клавишей F5 и при выходе из незаконченной партии
+    snapshot = take_game_snapshot(field, pool, tab)
+    history = History()
+
+    # Поиск подсказки выполняется в фоновом процессе, чтобы не задерживать отрисовку
+    worker = Worker()
 
     mode = GAME_MODE
+    full_redraw = True
     while True:
 
-        events = pg.event.get()
-        for event in events:
-            if event.type == pg.QUIT:
-                pg.quit()
-                exit()
-
-            if mode == GAME_MODE:
-                if event.type == pg.MOUSEBUTTONDOWN and event.button == pg.BUTTON_LEFT:
-                    drag_and_drop.take(*event.pos)
-
-                if event.type == pg.MOUSEMOTION:
-                    drag_and_drop.drag(*event.rel)
-
-                if event.type == pg.MOUSEBUTTONUP and event.button == pg.BUTTON_LEFT:
-                    drop_result = drag_and_drop.drop()
-                    if not drop_result:
-                        continue
+        frame_start = perf_counter()
 
-                    field.refresh_field()
-                    pool.refresh_slots()
-
-                    score_data = field.get_scored_data()
-                    tab.update_score(*score_data)
-
-                    figures_in_pool = pool.get_current_figures_list()
-                    if not field.check_figures_list(figures_in_pool):
-                        tab.set_final_text()
-                        mode = FINAL_MODE
+        events = pg.event.get()
+        with profiler.section('events'):
+            for event in events:
+                if event.type == pg.QUIT:
+                    if profiler.enabled:
+                        profiler.export_chrome_trace(PROFILING_TRACE_FILE)
+                    worker.shutdown()
+                    if mode == GAME_MODE:
+                        save_game(SAVE_FILE, snapshot, recorder.path, recorder.get_size())
+                    recorder.close()
+                    pg.quit()
+                    exit()
+
+                # Колесо мыши изменяет масштаб поля, перемещение с зажатой правой кнопкой сдвигает поле
+                if event.type == pg.MOUSEWHEEL:
+                    field.camera.zoom_at(CAMERA_ZOOM_STEP ** event.y, *pg.mouse.get_pos())
+
+                if event.type == pg.MOUSEMOTION and event.buttons[2]:
+                    field.camera.pan(*event.rel)
+
+                # Отмена хода возможна и после окончания партии. Фигуру, которую тащат, сначала нужно отпустить
+                if event.type == pg.KEYDOWN and is_undo_key(event) and not drag_and_drop.figure and history:
+                    worker.cancel()
+                    snapshot = history.pop()
+                    restore_game(field, pool, tab, snapshot)
+                    recorder.write_undo()
+                    mode = GAME_MODE
+                    continue
+
+                if mode == GAME_MODE:
+                    if event.type == pg.KEYDOWN and event.key == pg.K_F5:
+                        save_game(SAVE_FILE, snapshot, recorder.path, recorder.get_size())
+
+                    # Пока фигуру тащат, подсказка не нужна: она устареет сразу после хода
+                    if event.type == pg.KEYDOWN and event.key == pg.K_h and not drag_and_drop.figure:
+                        shape_indices = [slot[0] if slot else None for slot in pool.figure_pool.slots]
+                        worker.submit(find_best_move, get_snapshot(field.board, shape_indices), HINT_TIME_BUDGET)
+
+                    # Игрок начал ход сам - подсказка для прежнего состояния больше не нужна
+                    if event.type == pg.MOUSEBUTTONDOWN and event.button == pg.BUTTON_LEFT:
+                        worker.cancel()
+                        drag_and_drop.take(*event.pos)
+
+                    if event.type == pg.MOUSEMOTION:
+                        drag_and_drop.drag(*event.rel)
+
+                    if event.type == pg.MOUSEBUTTONUP and event.button == pg.BUTTON_LEFT:
+                        drop_result = drag_and_drop.drop()
+                        if not drop_result:
+                            continue
+
+                        # Подсказка, которая ищется для поля до хода, больше не нужна
+                        worker.cancel()
+                        slot_index, (shape_index, _) = pool.taken_slot
+                        recorder.write_drop(slot_index, shape_index, field.last_anchor)
+                        history.push(snapshot)
+
+                        field.refresh_field()
+                        for slot_index in pool.refresh_slots():
+                            recorder.write_draw(slot_index, *pool.figure_pool.slots[slot_index])
+
+                        score_data = field.get_scored_data()
+                        tab.update_score(*score_data)
+                        snapshot = take_game_snapshot(field, pool, tab)
+
+                        figures_in_pool = pool.get_current_figures_list()
+                        if not field.check_figures_list(figures_in_pool):
+                            tab.set_final_text()
+                            recorder.write_end(tab.target_score)
+                            remove_save()
+                            mode = FINAL_MODE
+                            break
+
+                elif mode == FINAL_MODE:
+                    if event.type == pg.KEYDOWN:
+                        worker.cancel()
+                        recorder.close()
+                        field, pool, drag_and_drop, tab, recorder = init_new_game(sc, profiler, args.layers)
+                        snapshot = take_game_snapshot(field, pool, tab)
+                        history.clear()
+                        mode = GAME_MODE
+                        full_redraw = True
                         break
 
-            elif mode == FINAL_MODE:
-                if event.type == pg.KEYDOWN:
-                    field, pool, drag_and_drop, tab = init_new_game(sc)
-                    mode = GAME_MODE
-                    break
+            # Перемещения мыши за кадр уже сложены, фигуру сдвигаем один раз. Гекс под фигурой может измениться
+            # и без перемещения мыши, если сдвинулась камера
+            drag_and_drop.apply_motion()
+
+        hint = worker.poll()
+        if hint and mode == GAME_MODE and not drag_and_drop.figure:
+            field.show_hint(hint[1])
 
-        background.draw()
-        field.draw()
-        pool.draw()
-        drag_and_drop.draw()
-        tab.draw()
+        animator.update(clock.get_time() / 1000)
+        render(sc, [background, field, pool, drag_and_drop, tab] + overlay_layers, full_redraw)
+        full_redraw = False
 
-        pg.display.update()
+        if profiler.enabled:
+            profiler.add_sample('frame', frame_start, perf_counter())
         clock.tick(FPS)
 
 
@@ -0,0 +1,30 @@
+"""Проверка совпадения правил пакетной среды с core.Board. Запуск: python -m unittest"""
+import unittest
+import numpy as np
+from settings import POOL_SIZE
+from batch_env import BatchEnv, check_parity
+
+
+class BatchEnvTest(unittest.TestCase):
+
+    def test_parity(self):
+        self.assertEqual(check_parity(32, 200, 4, 0), 0)
+
+    def test_parity_on_large_board(self):
+        self.assertEqual(check_parity(4, 40, 12, 1), 0)
+
+    def test_legal_actions(self):
+        env = BatchEnv(8, 6, 2)
+        self.assertEqual(env.legal.shape, (8, POOL_SIZE, env.cells_count))
+        self.assertEqual(env.get_legal_actions().shape, (8, env.actions_count))
+        self.assertFalse(env.done.any())
+
+    def test_illegal_action(self):
+        env = BatchEnv(2, 4, 3)
+        actions = np.argmin(env.get_legal_actions(), axis=1)
+        with self.assertRaises(ValueError):
+            env.step(actions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+"""
+Массовая симуляция партий без отрисовки на всех ядрах процессора для настройки FIGURES_DATA и COLOR_PRESETS.
+Результаты каждой партии построчно записываются в CSV по мере завершения партий.
+Запуск: python tournament.py --games 1000 --strategy greedy [--workers 8] [--output tournament.csv]
+Воспроизводимый перебор на заданную глубину вместо ограничения по времени: --strategy lookahead --depth 2
+"""
+import os
+import csv
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+from settings import LAYERS_COUNT, SOLVER_TIME_BUDGET
+from core import Game
+from solver import Solver
+
+# Причины окончания партии
+CAUSE_NO_MOVES = 'no_moves'
+CAUSE_MOVE_LIMIT = 'move_limit'
+
+# depth - средняя полностью просмотренная глубина перебора за ход, nodes - количество просмотренных ходов за партию
+FIELDS = ('seed', 'strategy', 'score', 'moves', 'lines', 'cause', 'depth', 'nodes', 'seconds')
+
+
+class RandomStrategy:
+    """Случайный ход из всех доступных"""
+
+    def __init__(self, game, seed, time_budget, max_depth):
+        self.game = game
+        self.rng = random.Random(seed)
+        self.nodes = self.depth_sum = 0
+
+    def get_move(self):
+        moves = [
+            (slot_index, number)
+            for slot_index, slot in enumerate(self.game.pool.slots) if slot
+            for number in self.game.board.get_legal_placements(slot[0])
+        ]
+        return self.rng.choice(moves) if moves else None
+
+
+class LookaheadStrategy:
+    """
+    Лучший ход по результатам перебора порядка и мест размещения всех фигур пула. Перебор ограничивается временем
+    на ход или, если передана max_depth, глубиной
+    """
+    MAX_DEPTH = None
+
+    def __init__(self, game, seed, time_budget, max_depth):
+        self.game = game
+        self.max_depth = self.MAX_DEPTH or max_depth
+
+        # При ограничении глубины время не ограничивается: ход зависит только от состояния партии,
+        # и результаты воспроизводятся на любой машине
+        self.time_budget = float('inf') if self.max_depth else time_budget
+        self.solver = Solver(game.board, self.time_budget)
+        self.nodes = self.depth_sum = 0
+
+    def get_move(self):
+        shape_indices = [slot[0] if slot else None for slot in self.game.pool.slots]
+        move = self.solver.get_best_move(shape_indices, self.time_budget, self.max_depth)
+        self.nodes += self.solver.nodes
+        self.depth_sum += self.solver.completed_depth
+        return move
+
+
+class GreedyStrategy(LookaheadStrategy):
+    """Лучший ход по очкам и оценке поля сразу после него, без учета следующих ходов"""
+    MAX_DEPTH = 1
+
+
+STRATEGIES = {
+    'random': RandomStrategy,
+    'greedy': GreedyStrategy,
+    'lookahead': LookaheadStrategy
+}
+
+
+def play_game(seed, strategy_name, layers_count, time_budget, max_moves, max_depth=None):
+    """Функция играет одну партию и возвращает её результат. Выполняется в процессе-исполнителе"""
+    start = perf_counter()
+    game = Game(seed, layers_count)
+    strategy = STRATEGIES[strategy_name](game, seed, time_budget, max_depth)
+    moves = lines = 0
+    cause = CAUSE_NO_MOVES
+    while not game.is_over():
+        if max_moves and moves >= max_moves:
+            cause = CAUSE_MOVE_LIMIT
+            break
+        if not game.put_figure(*strategy.get_move()):
+            raise RuntimeError('Стратегия {} выбрала недопустимый ход'.format(strategy_name))
+        moves += 1
+        lines += game.board.last_line_remove_count
+
+    return {
+        'seed': seed,
+        'strategy': strategy_name,
+        'score': int(game.score),
+        'moves': moves,
+        'lines': lines,
+        'cause': cause,
+        'depth': round(strategy.depth_sum / moves, 2) if moves else 0,
+        'nodes': strategy.nodes,
+        'seconds': round(perf_counter() - start, 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Симуляция партий с выбранной стратегией на всех ядрах')
+    parser.add_argument('--games', type=int, default=100, help='количество партий')
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='greedy', help='стратегия размещения фигур')
+    parser.add_argument('--seed', type=int, default=0, help='зерно первой партии, следующие получают seed + 1...')
+    parser.add_argument('--layers', type=int, default=LAYERS_COUNT, help='количество слоев поля')
+    parser.add_argument('--time-budget', type=float, default=SOLVER_TIME_BUDGET, help='время на ход для lookahead')
+    parser.add_argument(
+        '--depth', type=int, default=0, help='глубина перебора для lookahead вместо ограничения по времени (0 - нет)'
+    )
+    parser.add_argument('--max-moves', type=int, default=0, help='ограничение количества ходов в партии (0 - нет)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='количество процессов')
+    parser.add_argument('--output', default='tournament.csv', help='файл для результатов партий')
+    args = parser.parse_args()
+
+    seeds = range(args.seed, args.seed + args.games)
+    start = perf_counter()
+    total_score = 0
+    with open(args.output, 'w', newline='') as output_file, ProcessPoolExecutor(args.workers) as executor:
+        writer = csv.DictWriter(output_file, FIELDS)
+        writer.writeheader()
+        # Партии отправляются по одной, чтобы результаты записывались в порядке завершения партий, а не их зерен
+        futures = [
+            executor.submit(
+                play_game, seed, args.strategy, args.layers, args.time_budget, args.max_moves, args.depth or None
+            )
+            for seed in seeds
+        ]
+        for played, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            writer.writerow(result)
+            output_file.flush()
+            total_score += result['score']
+            if played % 100 == 0 or played == args.games:
+                elapsed = perf_counter() - start
+                print('Партий: {}/{}, средний счет {:.1f}, {:.1f} партий/с'.format(
+                    played, args.games, total_score / played, played / elapsed
+                ))
+
+
+if __name__ == '__main__':
+    main()
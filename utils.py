@@ -1,20 +1,40 @@
+from functools import lru_cache
 from math import pi, cos, sin, sqrt
-from settings import RADIUS, HEX_MARGIN, SMOOTH_FACTOR, SMOOTH_DEPTH
+from settings import RADIUS, NORMAL, HEX_MARGIN, SMOOTH_FACTOR, SMOOTH_DEPTH, SCALE_STEP, HEXAGON_CACHE_SIZE
 
 
-def create_hexagon_coords(x0, y0, scale):
+def create_hexagon_coords(x0, y0, scale, smooth_depth=SMOOTH_DEPTH):
+    """Функция возвращает координаты гекса с центром в точке (x0, y0): кэшированный шаблон, сдвинутый в эту точку"""
+    template = get_hexagon_template(round(scale / SCALE_STEP), smooth_depth)
+    return [(x0 + x, y0 + y) for x, y in template]
+
+
+@lru_cache(maxsize=HEXAGON_CACHE_SIZE)
+def get_hexagon_template(scale_steps, smooth_depth=SMOOTH_DEPTH):
+    """
+    Функция возвращает координаты гекса с центром в начале координат и масштабом scale_steps * SCALE_STEP.
+    Углы гекса сглаживаются smooth_depth раз
+    """
+    scale = scale_steps * SCALE_STEP
     alpha = pi / 6
     delta_alpha = pi / 3
     coords = []
     for _ in range(6):
         coords.append(
             (
-                x0 + scale * (RADIUS - HEX_MARGIN) * cos(alpha),
-                y0 - scale * (RADIUS - HEX_MARGIN) * sin(alpha)
+                scale * (RADIUS - HEX_MARGIN) * cos(alpha),
+                -scale * (RADIUS - HEX_MARGIN) * sin(alpha)
             )
         )
         alpha += delta_alpha
-    return smooth(coords, SMOOTH_DEPTH)
+    return tuple(smooth(coords, smooth_depth))
+
+
+@lru_cache(maxsize=HEXAGON_CACHE_SIZE)
+def get_hexagon_extents(scale_steps):
+    """Функция возвращает половину ширины и половину высоты сглаженного гекса с масштабом scale_steps * SCALE_STEP"""
+    template = get_hexagon_template(scale_steps)
+    return max(abs(x) for x, _ in template), max(abs(y) for _, y in template)
 
 
 def smooth(coords, depth):
@@ -48,13 +68,31 @@ def smooth(coords, depth):
     return smooth(smooth_coords, depth - 1)
 
 
-def normalize_value(value):
-    if value < 0:
-        return -1
-    elif value > 0:
-        return 1
-    return value
-
-
 def get_distance(x1, y1, x2, y2):
     return sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
+
+
+def cube_to_pixel(x_axis, z_axis, normal=NORMAL):
+    """Функция возвращает смещение центра гекса с переданными координатами на осях относительно центра поля"""
+    return normal * (x_axis + 2 * z_axis), -sqrt(3) * normal * x_axis
+
+
+def pixel_to_cube(delta_x, delta_y, normal=NORMAL):
+    """
+    Функция возвращает координаты на осях гекса, в который попадает точка со смещением (delta_x, delta_y)
+    относительно центра поля
+    """
+    x_axis = -delta_y / (sqrt(3) * normal)
+    z_axis = delta_x / (2 * normal) - x_axis / 2
+    y_axis = x_axis + z_axis
+
+    # Округляем до ближайшего гекса: сумма x_axis - y_axis + z_axis всегда должна оставаться равной нулю
+    rx, ry, rz = round(x_axis), round(y_axis), round(z_axis)
+    dx, dy, dz = abs(rx - x_axis), abs(ry - y_axis), abs(rz - z_axis)
+    if dx > dy and dx > dz:
+        rx = ry - rz
+    elif dy > dz:
+        ry = rx + rz
+    else:
+        rz = ry - rx
+    return rx, ry, rz
@@ -0,0 +1,88 @@
+"""Фоновые вычисления: поиск хода выполняется в отдельном процессе, чтобы не задерживать отрисовку кадров"""
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from core import Board
+from solver import Solver
+
+# Решатели процесса-исполнителя для каждого размера поля. Таблица переходов сохраняется между запросами
+_solvers = {}
+
+
+def get_snapshot(board, shape_indices):
+    """Функция возвращает неизменяемый снимок состояния игры, который можно передать в другой процесс"""
+    return board.layers_count, board.occupancy, tuple(shape_indices)
+
+
+def find_best_move(snapshot, time_budget):
+    """
+    Функция ищет лучший ход для снимка состояния игры и возвращает пару (номер слота, номера гексов, которые займет
+    фигура) или None, если ни одну фигуру разместить нельзя. Выполняется в процессе-исполнителе
+    """
+    layers_count, occupancy, shape_indices = snapshot
+    solver = _solvers.get(layers_count)
+    if solver is None:
+        solver = _solvers[layers_count] = Solver(Board(layers_count))
+    # Счетчики размещений пересчитываются только для гексов, изменившихся с прошлого запроса
+    solver.board.set_occupancy(occupancy)
+
+    move = solver.get_best_move(shape_indices, time_budget)
+    if not move:
+        return None
+    slot_index, anchor = move
+    return slot_index, solver.get_move_cells(shape_indices[slot_index], anchor)
+
+
+class Worker:
+    """
+    Исполнитель фоновых задач. Результаты складываются в очередь, которую игровой цикл опрашивает на каждом кадре.
+    Актуален только результат последней задачи: отмененные и устаревшие задачи игнорируются
+    """
+
+    def __init__(self, max_workers=1):
+        # Процессы-исполнители запускаются заново, а не копируют процесс игры вместе с pygame
+        self.executor = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn'))
+        self.results = queue.Queue()
+        self.request_id = 0
+        self.future = None
+
+    def submit(self, function, *args):
+        """Метод отменяет предыдущую задачу, запускает новую и возвращает её номер"""
+        self.cancel()
+        request_id = self.request_id
+        self.future = self.executor.submit(function, *args)
+        self.future.add_done_callback(lambda future: self.results.put((request_id, future)))
+        return request_id
+
+    def cancel(self):
+        """
+        Метод отменяет текущую задачу. Задачу, которая уже выполняется, прервать нельзя,
+        поэтому её результат просто будет пропущен
+        """
+        if self.future:
+            self.future.cancel()
+            self.future = None
+        self.request_id += 1
+
+    def poll(self):
+        """Метод возвращает результат последней задачи, если он готов, иначе None"""
+        result = None
+        while True:
+            try:
+                request_id, future = self.results.get_nowait()
+            except queue.Empty:
+                return result
+            if request_id == self.request_id and not future.cancelled():
+                self.future = None
+                # Ошибка в процессе-исполнителе не должна останавливать игру: подсказка просто не показывается
+                try:
+                    result = future.result()
+                except Exception:
+                    result = None
+
+    def is_busy(self):
+        return self.future is not None
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)